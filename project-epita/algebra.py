@@ -1,4 +1,7 @@
 import math
+import metrics
+from backend import mpz, mulmod, powmod, invert
+from functools import lru_cache
 
 def int_to_bytes(n):
     """Converts int to bytes."""
@@ -6,23 +9,27 @@ def int_to_bytes(n):
 
 
 def mod_inv(a, n):
-    t, r = 1, a
-    new_t, new_r = 0, n
+    if metrics.ENABLED:
+        metrics.count("mod_inv")
+    return invert(a, n)
 
-    while new_r != 0:
-        quotient = r // new_r
-        t, new_t = new_t, t - quotient * new_t
-        r, new_r = new_r, r - quotient * new_r
-
-    if r > 1:
-        raise Exception("a is not invertible")
-    if t < 0:
-        t = t + n
-    return t
+def batch_inv(values, n):
+    """Inverts every element of values modulo n with a single mod_inv (Montgomery's trick)."""
+    prefix = []
+    acc = 1
+    for a in values:
+        prefix.append(acc)
+        acc = mulmod(acc, a, n)
+    acc_inv = mod_inv(acc, n)
+    inverses = [0] * len(values)
+    for i in range(len(values) - 1, -1, -1):
+        inverses[i] = mulmod(acc_inv, prefix[i], n)
+        acc_inv = mulmod(acc_inv, values[i], n)
+    return inverses
 
 def mod_sqrt(a, p):
     def legendre_symbol(a, p):
-        ls = pow(a, (p - 1) // 2, p)
+        ls = powmod(a, (p - 1) // 2, p)
         return -1 if ls == p - 1 else ls
     if legendre_symbol(a, p) != 1:
         return 0
@@ -31,7 +38,7 @@ def mod_sqrt(a, p):
     elif p == 2:
         return p
     elif p % 4 == 3:
-        return pow(a, (p + 1) // 4, p)
+        return powmod(a, (p + 1) // 4, p)
     s = p - 1
     e = 0
     while s % 2 == 0:
@@ -40,9 +47,9 @@ def mod_sqrt(a, p):
     n = 2
     while legendre_symbol(n, p) != -1:
         n += 1
-    x = pow(a, (s + 1) // 2, p)
-    b = pow(a, s, p)
-    g = pow(n, s, p)
+    x = powmod(a, (s + 1) // 2, p)
+    b = powmod(a, s, p)
+    g = powmod(n, s, p)
     r = e
     while True:
         t = b
@@ -50,13 +57,121 @@ def mod_sqrt(a, p):
         for m in range(r):
             if t == 1:
                 break
-            t = pow(t, 2, p)
+            t = powmod(t, 2, p)
 
         if m == 0:
             return x
 
-        gs = pow(g, 2 ** (r - m - 1), p)
+        gs = powmod(g, 2 ** (r - m - 1), p)
         g = (gs * gs) % p
         x = (x * gs) % p
         b = (b * g) % p
         r = m
+
+
+def pow2(g1: int, e1: int, g2: int, e2: int, p: int, w: int = 2) -> int:
+    """
+    Simultaneous exponentiation g1^e1 * g2^e2 mod p (Straus/Shamir trick):
+    one shared chain of squarings and a table of g1^a * g2^b for a, b < 2^w.
+    """
+    if metrics.ENABLED:
+        metrics.count("mod_exp_double")
+    g1, g2, p = mpz(g1), mpz(g2), mpz(p)
+    size = 2**w
+    row = [1]
+    for _ in range(size - 1):
+        row.append(row[-1] * g1 % p)
+    table = [row]
+    for _ in range(size - 1):
+        table.append([t * g2 % p for t in table[-1]])
+    mask = size - 1
+    n = max(e1.bit_length(), e2.bit_length())
+    r = 1
+    for shift in range(((n + w - 1) // w - 1) * w, -1, -w):
+        for _ in range(w):
+            r = r * r % p
+        r = r * table[(e2 >> shift) & mask][(e1 >> shift) & mask] % p
+    return int(r)
+
+def multi_pow(bases, exps, p: int) -> int:
+    """
+    Multi-exponentiation prod(b_i^e_i) mod p with Pippenger's bucket method:
+    the squarings are shared and each window costs one multiplication per base.
+    """
+    if metrics.ENABLED:
+        metrics.count("mod_exp_multi")
+    n = len(bases)
+    if n == 0:
+        return 1
+    bases, p = [mpz(b) for b in bases], mpz(p)
+    c = min(max(2, n.bit_length() - 2), 16)
+    mask = 2**c - 1
+    bits = max(e.bit_length() for e in exps)
+    r = 1
+    for shift in range(((bits + c - 1) // c - 1) * c, -1, -c):
+        for _ in range(c):
+            r = r * r % p
+        buckets = [1] * (mask + 1)
+        for b, e in zip(bases, exps):
+            d = (e >> shift) & mask
+            if d:
+                buckets[d] = buckets[d] * b % p
+        running, acc = 1, 1
+        for d in range(mask, 0, -1):
+            running = running * buckets[d] % p
+            acc = acc * running % p
+        r = r * acc % p
+    return int(r)
+
+class FixedBasePow:
+    """
+    Fixed-base modular exponentiation g^e mod p (Brickell-Gordon-McCurley-Wilson).
+    The table holds g^(2^(w*i)), so an exponentiation needs no squaring,
+    only about bits/w + 2^w multiplications.
+    """
+    def __init__(self, g: int, p: int, bits: int = None, w: int = 5):
+        self.g = g
+        self.p = p
+        self.bits = bits if bits is not None else p.bit_length()
+        self.w = w
+        self.table = None
+
+    def _build(self):
+        # Published only once complete, the table may be shared between threads
+        self.p_mpz = p = mpz(self.p)
+        table = []
+        b = mpz(self.g % self.p)
+        for _ in range((self.bits + self.w - 1) // self.w):
+            table.append(b)
+            for _ in range(self.w):
+                b = b * b % p
+        self.table = table
+
+    def pow(self, e: int) -> int:
+        if metrics.ENABLED:
+            metrics.count("mod_exp_fixed_base")
+        if e < 0 or e.bit_length() > self.bits:
+            return powmod(self.g, e, self.p)
+        if self.table is None:
+            self._build()
+        mask = 2**self.w - 1
+        buckets = [[] for _ in range(mask + 1)]
+        i = 0
+        while e:
+            d = e & mask
+            if d:
+                buckets[d].append(self.table[i])
+            e >>= self.w
+            i += 1
+        p = self.p_mpz
+        a, b = 1, 1
+        for d in range(mask, 0, -1):
+            for t in buckets[d]:
+                b = b * t % p
+            a = a * b % p
+        return int(a)
+
+@lru_cache(maxsize=16)
+def fixed_base_pow(g: int, p: int) -> FixedBasePow:
+    """Shared FixedBasePow instance for a given base, so its table is only built once."""
+    return FixedBasePow(g, p)
@@ -0,0 +1,124 @@
+### big-integer arithmetic backend
+###
+### gmpy2 (GMP) is used when it is installed, plain Python ints otherwise.
+### EVOTE_BIGINT=python or EVOTE_BIGINT=gmpy2 forces the choice.
+###
+###   mpz(x)             number type of the backend (int for pure Python)
+###   mulmod(a, b, m)    a * b mod m
+###   powmod(b, e, m)    b^e mod m, e may be negative when b is invertible (raises Exception otherwise)
+###   invert(a, m)       a^-1 mod m, raises Exception if a is not invertible
+###
+### Every function returns a Python int so callers never see mpz values
+### unless they ask for them with mpz(). Modular square roots
+### (algebra.mod_sqrt) are computed with powmod.
+
+import os
+import random
+
+try:
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+
+
+### pure Python
+
+def _py_mpz(x):
+    return x
+
+def _py_mulmod(a: int, b: int, m: int) -> int:
+    return a * b % m
+
+def _py_powmod(b: int, e: int, m: int) -> int:
+    try:
+        return pow(b, e, m)
+    except ValueError:
+        raise Exception("a is not invertible")
+
+def _py_invert(a: int, m: int) -> int:
+    t, r = 1, a
+    new_t, new_r = 0, m
+
+    while new_r != 0:
+        quotient = r // new_r
+        t, new_t = new_t, t - quotient * new_t
+        r, new_r = new_r, r - quotient * new_r
+
+    if r > 1:
+        raise Exception("a is not invertible")
+    if t < 0:
+        t = t + m
+    return t
+
+
+### gmpy2
+
+def _gmp_mpz(x):
+    return gmpy2.mpz(x)
+
+def _gmp_mulmod(a: int, b: int, m: int) -> int:
+    return int(gmpy2.f_mod(gmpy2.mul(a, b), m))
+
+def _gmp_powmod(b: int, e: int, m: int) -> int:
+    try:
+        return int(gmpy2.powmod(b, e, m))
+    except ValueError:
+        raise Exception("a is not invertible")
+
+def _gmp_invert(a: int, m: int) -> int:
+    try:
+        return int(gmpy2.invert(a, m))
+    except ZeroDivisionError:
+        raise Exception("a is not invertible")
+
+
+_BACKENDS = {
+    "python": (_py_mpz, _py_mulmod, _py_powmod, _py_invert),
+}
+if gmpy2 is not None:
+    _BACKENDS["gmpy2"] = (_gmp_mpz, _gmp_mulmod, _gmp_powmod, _gmp_invert)
+
+def available() -> list[str]:
+    return sorted(_BACKENDS)
+
+def _select(name: str = None) -> str:
+    name = name or os.environ.get("EVOTE_BIGINT") or ("gmpy2" if gmpy2 is not None else "python")
+    if name not in _BACKENDS:
+        raise ImportError(f"Big-integer backend {name!r} is not available (available: {available()})")
+    return name
+
+NAME = _select()
+mpz, mulmod, powmod, invert = _BACKENDS[NAME]
+
+
+def self_test(rounds: int = 50) -> list[str]:
+    """
+    Checks that every available backend gives the same results as the
+    pure Python one on the election moduli. Returns the backends checked.
+    """
+    from elgamal import PARAM_P, PARAM_Q
+    moduli = [PARAM_P, PARAM_Q, 2**255 - 19, 2**252 + 27742317777372353535851937790883648493, 13]
+    rng = random.Random(0)
+    reference = _BACKENDS["python"]
+    for name in available():
+        _, mul_, pow_, inv_ = _BACKENDS[name]
+        for m in moduli:
+            for _ in range(rounds):
+                a, b, e = rng.randrange(1, m), rng.randrange(m), rng.randrange(m)
+                results = (mul_(a, b, m), pow_(a, e, m), pow_(a, -e, m), inv_(a, m))
+                expected = (reference[1](a, b, m), reference[2](a, e, m), reference[2](a, -e, m), reference[3](a, m))
+                if results != expected or not all(type(r) is int for r in results):
+                    raise Exception(f"Backend {name} disagrees with the Python backend modulo {m}")
+        for inverse in (lambda: inv_(m, m), lambda: pow_(m, -1, m)):
+            try:
+                inverse()
+            except Exception as e:
+                if str(e) != "a is not invertible":
+                    raise
+            else:
+                raise Exception(f"Backend {name} inverted a non-invertible element")
+    return available()
+
+
+if __name__ == "__main__":
+    print(f"backend: {NAME}, self-test passed for {', '.join(self_test())}")
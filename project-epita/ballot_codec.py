@@ -0,0 +1,116 @@
+### binary wire format for encrypted ballots
+###
+### header (5 bytes): b"B" | version (1 byte) | kind (1 byte) | count (2 bytes, big-endian)
+### kind 0, ElGamal:    count * (c1, c2), each a fixed-width big-endian integer of ELGAMAL_WIDTH bytes
+### kind 1, EC ElGamal: count * (R, C), each a 32-byte RFC 7748 little-endian u-coordinate
+###                     with the parity of v in the top bit; the point at infinity is 32 bytes 0xff
+
+from typing import Union
+from rfc7748 import recoverVcoordinate
+import elgamal
+import metrics
+
+MAGIC = b"B"
+VERSION = 1
+KIND_ELGAMAL = 0
+KIND_EC = 1
+
+HEADER_SIZE = 5
+MAX_CIPHERTEXTS = 0xFFFF
+ELGAMAL_WIDTH = (elgamal.PARAM_P.bit_length() + 7) // 8
+POINT_WIDTH = 32
+INFINITY = b"\xff" * POINT_WIDTH
+
+EC_P = 2**255 - 19
+
+
+def encode_point(buf: bytearray, offset: int, P: tuple):
+    """Writes the POINT_WIDTH-byte encoding of P at buf[offset:]."""
+    if P == (1, 0):
+        buf[offset:offset + POINT_WIDTH] = INFINITY
+        return
+    u, v = P[0] % EC_P, P[1] % EC_P
+    buf[offset:offset + POINT_WIDTH] = (u | (v & 1) << 255).to_bytes(POINT_WIDTH, "little")
+
+def decode_point(view: memoryview) -> tuple:
+    """Point of a POINT_WIDTH-byte encoding, raises ValueError if it is invalid."""
+    if view == INFINITY:
+        return (1, 0)
+    n = int.from_bytes(view, "little")
+    u, parity = n & (2**255 - 1), n >> 255
+    if u >= EC_P:
+        raise ValueError("Invalid ballot: non-canonical u-coordinate")
+    v = recoverVcoordinate(u, parity)
+    if v is None:
+        raise ValueError("Invalid ballot: point is not on the curve")
+    return (u, v)
+
+
+@metrics.instrumented("ballot.serialize")
+def encode_ballot(ciphertexts: list, elgamal_method: str) -> bytes:
+    """
+    Encodes one ciphertext per candidate, (c1, c2) for ElGamal
+    or (R, C) for EC ElGamal (elgamal_method == "el").
+    """
+    count = len(ciphertexts)
+    if count > MAX_CIPHERTEXTS:
+        raise ValueError(f"A ballot holds at most {MAX_CIPHERTEXTS} ciphertexts, got {count}")
+    if elgamal_method == "el":
+        kind, width = KIND_EC, 2 * POINT_WIDTH
+    else:
+        kind, width = KIND_ELGAMAL, 2 * ELGAMAL_WIDTH
+    buf = bytearray(HEADER_SIZE + count * width)
+    buf[0:1] = MAGIC
+    buf[1] = VERSION
+    buf[2] = kind
+    buf[3:5] = count.to_bytes(2, "big")
+    offset = HEADER_SIZE
+    for first, second in ciphertexts:
+        if kind == KIND_EC:
+            encode_point(buf, offset, first)
+            encode_point(buf, offset + POINT_WIDTH, second)
+        else:
+            buf[offset:offset + ELGAMAL_WIDTH] = first.to_bytes(ELGAMAL_WIDTH, "big")
+            buf[offset + ELGAMAL_WIDTH:offset + width] = second.to_bytes(ELGAMAL_WIDTH, "big")
+        offset += width
+    return bytes(buf)
+
+
+@metrics.instrumented("ballot.deserialize")
+def decode_ballot(data: Union[bytes, bytearray, memoryview, str]) -> list:
+    """
+    Decodes a ballot into its list of ciphertexts.
+    The legacy text format ("c1_c2" or "Ru_Rv_Cu_Cv" lines) is still accepted.
+    """
+    if isinstance(data, str):
+        return _decode_text(data)
+    view = memoryview(data)
+    if len(view) < HEADER_SIZE or view[0:1] != MAGIC:
+        raise ValueError("Invalid ballot: bad header")
+    if view[1] != VERSION:
+        raise ValueError(f"Unsupported ballot version {view[1]}")
+    kind = view[2]
+    count = int.from_bytes(view[3:5], "big")
+    width = 2 * POINT_WIDTH if kind == KIND_EC else 2 * ELGAMAL_WIDTH
+    if kind not in (KIND_EC, KIND_ELGAMAL) or len(view) != HEADER_SIZE + count * width:
+        raise ValueError("Invalid ballot: bad length")
+    ciphertexts = []
+    for offset in range(HEADER_SIZE, len(view), width):
+        if kind == KIND_EC:
+            ciphertexts.append((decode_point(view[offset:offset + POINT_WIDTH]),
+                                decode_point(view[offset + POINT_WIDTH:offset + width])))
+        else:
+            ciphertexts.append((int.from_bytes(view[offset:offset + ELGAMAL_WIDTH], "big"),
+                                int.from_bytes(view[offset + ELGAMAL_WIDTH:offset + width], "big")))
+    return ciphertexts
+
+
+def _decode_text(msg: str) -> list:
+    ciphertexts = []
+    for line in msg.strip().split("\n"):
+        parts = list(map(int, line.split("_")))
+        if len(parts) == 4:
+            ciphertexts.append(((parts[0], parts[1]), (parts[2], parts[3])))
+        else:
+            ciphertexts.append((parts[0], parts[1]))
+    return ciphertexts
@@ -0,0 +1,245 @@
+### asyncio ballot submission server in front of VoteSystem
+###
+### protocol: one JSON object per line, over TCP or a Unix socket
+###   {"op": "register", "name": "alice"}          -> {"ok": true}
+###   {"op": "vote", "name": "alice", "choice": 2}  -> {"ok": true}   (choice is 1-based)
+###   {"op": "status"}                              -> {"ok": true, "voters": ..., "ballots": ...}
+### errors are returned as {"ok": false, "error": "..."}
+###
+### key generation, encryption and signing run in an executor (a process pool
+### by default); votes go through a bounded queue, so clients are slowed down
+### when it is full, and are handed to the executor in batches.
+
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from candidate import Candidates
+from voters import Voter
+from vote_system import VoteSystem
+from vote_encryption import VoteEncryption
+
+# VoteEncryption instances of a worker process, one per election configuration,
+# so their fixed-base tables are only built once
+_encryptions = {}
+
+
+def _encrypt_batch(config: tuple, jobs: list) -> list:
+    """Worker: encrypts and signs a batch of (vote_list, sign_key_x)."""
+    if config not in _encryptions:
+        _encryptions[config] = VoteEncryption(*config)
+    vote_encryption = _encryptions[config]
+    return [vote_encryption.encrypt_and_sign(vote_list, sign_key_x) for vote_list, sign_key_x in jobs]
+
+
+def _generate_sign_keys(sign_method: str) -> tuple:
+    """Worker: generates a voter's signing key pair."""
+    if sign_method == "el":
+        from ecdsa import ECDSA_generate_keys
+        return ECDSA_generate_keys()
+    from dsa import DSA_generate_keys
+    return DSA_generate_keys()
+
+
+class BallotServer:
+    def __init__(self, vote_system: VoteSystem, executor: Executor = None, workers: int = None,
+                 queue_size: int = 1024, batch_size: int = 32):
+        self.vote_system = vote_system
+        # Only an executor created here is shut down by stop()
+        self.owns_executor = executor is None
+        self.executor = executor if executor is not None else ProcessPoolExecutor(max_workers=workers)
+        self.queue = None
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        # Bounds the number of batches handed to the executor at the same time
+        self.in_flight = asyncio.Semaphore((workers or 4) * 2)
+        self.pending_voters = set()
+        self.config = (vote_system.sign_method, vote_system.elgamal_method, vote_system.eg_pu_key,
+                       None, vote_system.layout)
+        self.server = None
+        self.dispatcher = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0, path: str = None):
+        """Listens on a Unix socket if path is given, on host:port otherwise."""
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.dispatcher = asyncio.create_task(self._dispatch())
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._handle_client, path=path)
+        else:
+            self.server = await asyncio.start_server(self._handle_client, host, port)
+        return self.server
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.dispatcher is not None:
+            self.dispatcher.cancel()
+        if self.owns_executor:
+            self.executor.shutdown(wait=False)
+        self.vote_system.close()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = await self._handle_request(json.loads(line))
+                except Exception as e:
+                    response = {"ok": False, "error": str(e)}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, request: dict) -> dict:
+        op = request.get("op")
+        if op == "register":
+            return await self._register(request["name"])
+        if op == "vote":
+            return await self._vote(request["name"], int(request["choice"]))
+        if op == "status":
+            return {"ok": True, "voters": len(self.vote_system.voters_map),
+                    "ballots": len(self.vote_system.ballots)}
+        raise Exception(f"Unknown operation {op!r}")
+
+    async def _register(self, name: str) -> dict:
+        loop = asyncio.get_running_loop()
+        x, y = await loop.run_in_executor(self.executor, _generate_sign_keys, self.vote_system.sign_method)
+        self.vote_system.add_voter(Voter(name, self.vote_system.candidates, x, y))
+        return {"ok": True}
+
+    async def _vote(self, name: str, choice: int) -> dict:
+        if name not in self.vote_system.voters_map:
+            raise Exception("Voter not registered!")
+        if name in self.pending_voters:
+            raise Exception("A ballot from this voter is already being processed!")
+        if self.vote_system.voters_map.has_voted(name):
+            raise Exception("Voter has already voted!")
+        vote_list = [0] * self.vote_system.candidates.candidate_number
+        if not 1 <= choice <= len(vote_list):
+            raise Exception("Invalid candidate number!")
+        vote_list[choice - 1] = 1
+        voter = self.vote_system.voter(name)
+        voter.create_vote(vote_list)
+
+        done = asyncio.get_running_loop().create_future()
+        self.pending_voters.add(name)
+        try:
+            # Blocks this client while the queue is full (backpressure)
+            await self.queue.put((name, vote_list, voter.sign_key_x, done))
+            await done
+        finally:
+            self.pending_voters.discard(name)
+        return {"ok": True}
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            await self.in_flight.acquire()
+            future = loop.run_in_executor(self.executor, _encrypt_batch, self.config,
+                                          [(vote_list, key) for _, vote_list, key, _ in batch])
+            future.add_done_callback(lambda f, batch=batch: self._record(f, batch))
+
+    def _record(self, future, batch: list):
+        self.in_flight.release()
+        error = future.exception()
+        for i, (name, _, _, done) in enumerate(batch):
+            if done.done():
+                continue
+            if error is not None:
+                done.set_exception(error)
+                continue
+            ciphertexts, ballot = future.result()[i]
+            # A rejected ballot only fails its own client, the rest of the batch is recorded.
+            # Encrypted by the server's own workers: the subgroup check, two exponentiations
+            # per ciphertext, would only block the event loop
+            try:
+                self.vote_system.record_ballot(name, ciphertexts, ballot, check=False)
+            except Exception as e:
+                done.set_exception(e)
+            else:
+                done.set_result(None)
+
+
+### load testing client
+
+async def _simulated_voter(name: str, choice: int, host: str, port: int, path: str):
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for request in ({"op": "register", "name": name}, {"op": "vote", "name": name, "choice": choice}):
+            writer.write(json.dumps(request).encode() + b"\n")
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            if not response["ok"]:
+                raise Exception(response["error"])
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+async def load_test(voters: int, candidates: int, host: str = "127.0.0.1", port: int = None,
+                    path: str = None, concurrency: int = 256) -> dict:
+    """Registers and casts a ballot for `voters` simulated voters, `concurrency` at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(i):
+        async with semaphore:
+            await _simulated_voter(f"voter{i}", i % candidates + 1, host, port, path)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(i) for i in range(voters)))
+    elapsed = time.perf_counter() - start
+    return {"voters": voters, "seconds": elapsed, "ballots_per_second": voters / elapsed}
+
+
+async def _serve_and_load_test(args):
+    candidates = Candidates([f"C{i + 1}" for i in range(args.candidates)])
+    vote_system = VoteSystem(candidates, args.sign, args.enc)
+    server = BallotServer(vote_system, workers=args.workers, queue_size=args.queue_size,
+                          batch_size=args.batch_size)
+    listener = await server.start(port=0, path=args.unix)
+    port = None if args.unix else listener.sockets[0].getsockname()[1]
+    try:
+        print(json.dumps(await load_test(args.voters, args.candidates, port=port, path=args.unix,
+                                         concurrency=args.concurrency)))
+        print(vote_system.tally_votes())
+    finally:
+        await server.stop()
+
+async def _serve(args):
+    candidates = Candidates([f"C{i + 1}" for i in range(args.candidates)])
+    vote_system = VoteSystem(candidates, args.sign, args.enc)
+    server = BallotServer(vote_system, workers=args.workers, queue_size=args.queue_size,
+                          batch_size=args.batch_size)
+    listener = await server.start(args.host, args.port, args.unix)
+    print(f"Listening on {args.unix or listener.sockets[0].getsockname()}")
+    await listener.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ballot submission server")
+    parser.add_argument("command", choices=["serve", "load-test"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="Unix socket path instead of TCP")
+    parser.add_argument("--sign", default="default", help='"el" for ECDSA, DSA otherwise')
+    parser.add_argument("--enc", default="default", help='"el" for EC ElGamal, ElGamal otherwise')
+    parser.add_argument("--candidates", type=int, default=5)
+    parser.add_argument("--voters", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--queue-size", type=int, default=1024)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(_serve(args) if args.command == "serve" else _serve_and_load_test(args))
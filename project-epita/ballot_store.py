@@ -0,0 +1,144 @@
+### durable append-only ballot log
+###
+### header: b"BLOG" | version (1 byte) | election key fingerprint (32 bytes)
+### record: length (4 bytes, big-endian) | CRC-32 of the payload (4 bytes, big-endian) | payload
+### payload: voter name length (2 bytes) | name (utf-8) | msg length (4 bytes) | msg
+###          | signature count (1 byte) | count * (length (2 bytes) | big-endian integer)
+
+import mmap
+import os
+import zlib
+from typing import Iterator
+
+MAGIC = b"BLOG"
+VERSION = 2
+HEADER_SIZE = len(MAGIC) + 1 + 32
+RECORD_HEADER_SIZE = 8
+
+
+def _encode_record(entry: dict) -> bytes:
+    name = entry["voter"].encode("utf-8")
+    msg = entry["ballot"]["msg"]
+    if isinstance(msg, str):
+        msg = msg.encode("utf-8")
+    signature = entry["ballot"]["signature"]
+    parts = [len(name).to_bytes(2, "big"), name, len(msg).to_bytes(4, "big"), msg,
+             len(signature).to_bytes(1, "big")]
+    for n in signature:
+        raw = n.to_bytes((n.bit_length() + 7) // 8, "big")
+        parts += [len(raw).to_bytes(2, "big"), raw]
+    payload = b"".join(parts)
+    return len(payload).to_bytes(4, "big") + zlib.crc32(payload).to_bytes(4, "big") + payload
+
+def _decode_record(view: bytes) -> dict:
+    offset = 0
+    name_len = int.from_bytes(view[offset:offset + 2], "big")
+    offset += 2
+    name = str(view[offset:offset + name_len], "utf-8")
+    offset += name_len
+    msg_len = int.from_bytes(view[offset:offset + 4], "big")
+    offset += 4
+    msg = bytes(view[offset:offset + msg_len])
+    offset += msg_len
+    signature = []
+    for _ in range(view[offset]):
+        n_len = int.from_bytes(view[offset + 1:offset + 3], "big")
+        signature.append(int.from_bytes(view[offset + 3:offset + 3 + n_len], "big"))
+        offset += 2 + n_len
+    return {"voter": name, "ballot": {"msg": msg, "signature": tuple(signature)}}
+
+
+class BallotStore:
+    """
+    Append-only ballot log on disk, usable in place of VoteSystem.ballots.
+    Records are flushed and fsync'ed every fsync_every appends (and on sync/close),
+    a torn or corrupted record left by a crash (checked by its CRC-32 and by
+    decoding it) is dropped with everything after it when the log is reopened,
+    and iteration replays the log sequentially through a read-only mmap.
+    """
+    def __init__(self, path: str, key_fingerprint: bytes = bytes(32), fsync_every: int = 64):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.pending = 0
+        self.count = 0
+
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "ab+")
+        if new:
+            self.file.write(MAGIC + bytes([VERSION]) + key_fingerprint)
+            self.sync()
+            return
+
+        self.file.seek(0)
+        header = self.file.read(HEADER_SIZE)
+        error = None
+        if len(header) < HEADER_SIZE or header[:len(MAGIC)] != MAGIC:
+            error = "Not a ballot log!"
+        elif header[len(MAGIC)] != VERSION:
+            error = f"Unsupported ballot log version {header[len(MAGIC)]}"
+        elif header[len(MAGIC) + 1:] != key_fingerprint:
+            error = "Ballot log belongs to another election key!"
+        if error:
+            self.file.close()
+            raise Exception(error)
+        # Count the complete records and drop a torn one at the end
+        end = self._scan()
+        if end != os.path.getsize(path):
+            self.file.truncate(end)
+            self.sync()
+
+    def _scan(self) -> int:
+        """Counts the records up to the first torn or corrupted one, returns where it starts."""
+        size = os.path.getsize(self.path)
+        offset = HEADER_SIZE
+        with mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ) as m:
+            while offset + RECORD_HEADER_SIZE <= size:
+                length = int.from_bytes(m[offset:offset + 4], "big")
+                end = offset + RECORD_HEADER_SIZE + length
+                if end > size:
+                    break
+                # Slicing the mmap copies the payload, no buffer export outlives the loop
+                payload = m[offset + RECORD_HEADER_SIZE:end]
+                if zlib.crc32(payload) != int.from_bytes(m[offset + 4:offset + 8], "big"):
+                    break
+                try:
+                    # A zero-filled tail (delayed allocation) has valid CRCs but does not decode
+                    _decode_record(payload)
+                except (IndexError, ValueError):
+                    break
+                offset = end
+                self.count += 1
+        return offset
+
+    def append(self, entry: dict):
+        self.file.write(_encode_record(entry))
+        self.count += 1
+        self.pending += 1
+        if self.pending >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[dict]:
+        self.file.flush()
+        size = os.path.getsize(self.path)
+        with mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ) as m:
+            offset = HEADER_SIZE
+            while offset + RECORD_HEADER_SIZE <= size:
+                length = int.from_bytes(m[offset:offset + 4], "big")
+                end = offset + RECORD_HEADER_SIZE + length
+                if end > size:
+                    break
+                yield _decode_record(m[offset + RECORD_HEADER_SIZE:end])
+                offset = end
@@ -0,0 +1,49 @@
+### batch verification helpers shared by DSA and ECDSA
+
+from random import getrandbits
+
+def find_invalid(items: list, check_batch, check_one, threshold: int = 4) -> list[int]:
+    """
+    Returns the indices of the invalid items.
+    The whole list is first checked at once with check_batch; on failure it is
+    split in two halves which are checked recursively (bisection), and
+    groups smaller than threshold are checked one by one with check_one.
+    """
+    invalid = []
+    stack = [(0, len(items))]
+    while stack:
+        start, end = stack.pop()
+        if end - start <= 0:
+            continue
+        if end - start < threshold:
+            invalid += [i for i in range(start, end) if not check_one(items[i])]
+        elif not check_batch(items[start:end]):
+            middle = (start + end) // 2
+            stack.append((middle, end))
+            stack.append((start, middle))
+    return sorted(invalid)
+
+# Rounds of the amortized subgroup check, each one misses an element outside
+# the subgroup with probability at most 1/2
+SUBGROUP_ROUNDS = 24
+
+def outside_subgroup(elements: list, combine, in_subgroup, rounds: int = SUBGROUP_ROUNDS) -> set:
+    """
+    Returns the elements that are not in the prime-order subgroup.
+    Checking each element costs a full exponentiation (or scalar multiplication),
+    so with more elements than rounds, each round only checks the combination
+    (combine, a product or a sum) of a random subset of them. An element with a
+    small-order part changes the combination's membership whenever it is added
+    to or left out of the subset, so each round misses it with probability at
+    most 1/2, whatever the other elements. If a round fails, the elements are
+    checked one by one.
+    """
+    elements = list(dict.fromkeys(elements))
+    if len(elements) > rounds:
+        for _ in range(rounds):
+            mask = getrandbits(len(elements))
+            if not in_subgroup(combine([e for i, e in enumerate(elements) if mask >> i & 1])):
+                break
+        else:
+            return set()
+    return {e for e in elements if not in_subgroup(e)}
@@ -0,0 +1,374 @@
+### benchmark suite for the crypto primitives and the election pipeline
+###
+###   python benchmark.py --output bench.json                  run and save the results
+###   python benchmark.py --compare bench.json --threshold 0.2 fail if an operation got >20% slower
+###   python benchmark.py --only ecdsa --quick                 subset, fewer repetitions
+###   python benchmark.py --only import --no-macro             import times only
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from functools import lru_cache
+from random import randint, getrandbits
+
+import algebra
+import dsa
+import ecdsa
+import ecelgamal
+import elgamal
+import rfc7748
+from candidate import Candidates
+from voters import Voter
+from vote_system import VoteSystem
+
+EC_P = 2**255 - 19
+# Modules whose import time is measured, main.py being the CLI startup
+IMPORTS = ["main", "vote_system", "elgamal", "ecelgamal", "dsa", "ecdsa", "rfc7748"]
+# Phases timed by election(), the macro benchmarks are named election.<methods>.<size>.<phase>
+PHASES = ["setup", "register", "cast", "tally", "recount", "audit"]
+
+
+def measure(fn, repeat: int, number: int = 1) -> dict:
+    """Runs fn number times per sample, repeat samples; times are per call, in seconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return {"min": min(samples), "median": statistics.median(samples), "repeat": repeat, "number": number}
+
+
+def import_time(module: str) -> float:
+    """Cumulative import time of module in a fresh interpreter, in seconds (python -X importtime)."""
+    env = dict(os.environ)
+    # Bytecode is cached so that only the import itself is measured, not the compilation
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    run = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                         capture_output=True, text=True, check=True)
+    for line in reversed(run.stderr.splitlines()):
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) * 1e-6
+    raise Exception(f"No import time reported for {module}")
+
+
+def selected(name: str, only: str = None) -> bool:
+    return not only or only in name
+
+
+def import_benchmarks(repeat: int, only: str = None) -> dict:
+    results = {}
+    for module in IMPORTS:
+        name = f"import.{module}"
+        if not selected(name, only):
+            continue
+        import_time(module)
+        samples = [import_time(module) for _ in range(repeat)]
+        results[name] = {"min": min(samples), "median": statistics.median(samples),
+                         "repeat": repeat, "number": 1}
+    return results
+
+
+def micro_benchmarks(repeat: int, only: str = None) -> dict:
+    # Each case builds its inputs only when it is selected, the shared ones once
+    cases = {}
+
+    def case(name: str, number: int):
+        def register(build):
+            cases[name] = (build, number)
+            return build
+        return register
+
+    @lru_cache(maxsize=None)
+    def points():
+        G = (ecelgamal.BaseU, ecelgamal.BaseV)
+        P = rfc7748.mult(randint(1, ecelgamal.ORDER - 1), G[0], G[1], EC_P)
+        Q = rfc7748.mult(randint(1, ecelgamal.ORDER - 1), G[0], G[1], EC_P)
+        return G, P, Q
+
+    @lru_cache(maxsize=None)
+    def dsa_keys():
+        x, y = dsa.DSA_generate_keys()
+        return x, y, dsa.DSA_sign(b"benchmark", x)
+
+    @lru_cache(maxsize=None)
+    def ecdsa_keys():
+        x, P = ecdsa.ECDSA_generate_keys()
+        return x, P, ecdsa.ECDSA_sign(b"benchmark", x)
+
+    @lru_cache(maxsize=None)
+    def eg_keys():
+        x, y = elgamal.EG_generate_keys()
+        return x, y, elgamal.EGA_encrypt(1, y)
+
+    @lru_cache(maxsize=None)
+    def sg_keys():
+        x, y = elgamal.EG_generate_keys(q=elgamal.PARAM_Q)
+        return x, y, elgamal.EGA_encrypt(1, y, q=elgamal.PARAM_Q)
+
+    @lru_cache(maxsize=None)
+    def ec_keys():
+        x, P = ecelgamal.ECEG_generate_keys()
+        return x, P, ecelgamal.ECEG_encrypt(1, P)
+
+    @case("rfc7748.add", 200)
+    def _():
+        _, P, Q = points()
+        return lambda: rfc7748.add(P[0], P[1], Q[0], Q[1], EC_P)
+
+    @case("rfc7748.mult", 5)
+    def _():
+        _, P, _ = points()
+        k = randint(1, ecelgamal.ORDER - 1)
+        return lambda: rfc7748.mult(k, P[0], P[1], EC_P)
+
+    @case("rfc7748.mult_base", 20)
+    def _():
+        k = randint(1, ecelgamal.ORDER - 1)
+        return lambda: ecelgamal.BASE.mult(k)
+
+    @case("rfc7748.x25519", 5)
+    def _():
+        scalar = getrandbits(256).to_bytes(32, "little")
+        u = rfc7748.encodeUCoordinate(9, 255)
+        return lambda: rfc7748.x25519(scalar, u)
+
+    @case("algebra.mod_inv", 200)
+    def _():
+        a = randint(1, EC_P - 1)
+        return lambda: algebra.mod_inv(a, EC_P)
+
+    @case("algebra.mod_sqrt", 20)
+    def _():
+        a = randint(1, EC_P - 1)
+        square = a * a % EC_P
+        return lambda: algebra.mod_sqrt(square, EC_P)
+
+    @case("dsa.sign", 5)
+    def _():
+        x, _, _ = dsa_keys()
+        return lambda: dsa.DSA_sign(b"benchmark", x)
+
+    @case("dsa.verify", 5)
+    def _():
+        _, y, sig = dsa_keys()
+        return lambda: dsa.DSA_verify(b"benchmark", sig[0], sig[1], y)
+
+    # 64 signatures checked one by one, then with a single batch verification
+    @lru_cache(maxsize=None)
+    def dsa_batch():
+        x, y, _ = dsa_keys()
+        return [(b"benchmark", dsa.DSA_sign(b"benchmark", x, commit=True), y) for _ in range(64)]
+
+    @case("dsa.verify_64", 1)
+    def _():
+        items = dsa_batch()
+        return lambda: [dsa.DSA_verify(m, sig[0], sig[1], y) for m, sig, y in items]
+
+    @case("dsa.verify_batch_64", 1)
+    def _():
+        items = dsa_batch()
+        return lambda: dsa.DSA_verify_batch(items)
+
+    @case("ecdsa.sign", 5)
+    def _():
+        x, _, _ = ecdsa_keys()
+        return lambda: ecdsa.ECDSA_sign(b"benchmark", x)
+
+    @case("ecdsa.verify", 5)
+    def _():
+        _, P, sig = ecdsa_keys()
+        return lambda: ecdsa.ECDSA_verify(b"benchmark", sig[0], sig[1], P)
+
+    @lru_cache(maxsize=None)
+    def ecdsa_batch():
+        x, P, _ = ecdsa_keys()
+        return [(b"benchmark", ecdsa.ECDSA_sign(b"benchmark", x, commit=True), P) for _ in range(64)]
+
+    @case("ecdsa.verify_64", 1)
+    def _():
+        items = ecdsa_batch()
+        return lambda: [ecdsa.ECDSA_verify(m, sig[0], sig[1], P) for m, sig, P in items]
+
+    @case("ecdsa.verify_batch_64", 1)
+    def _():
+        items = ecdsa_batch()
+        return lambda: ecdsa.ECDSA_verify_batch(items)
+
+    @case("elgamal.encrypt", 3)
+    def _():
+        _, y, _ = eg_keys()
+        return lambda: elgamal.EGA_encrypt(1, y)
+
+    @case("elgamal.decrypt", 3)
+    def _():
+        x, _, ct = eg_keys()
+        return lambda: elgamal.EG_decrypt(ct[0], ct[1], x)
+
+    @case("elgamal.encrypt_subgroup", 3)
+    def _():
+        _, y, _ = sg_keys()
+        return lambda: elgamal.EGA_encrypt(1, y, q=elgamal.PARAM_Q)
+
+    @case("elgamal.decrypt_subgroup", 3)
+    def _():
+        x, _, ct = sg_keys()
+        return lambda: elgamal.EG_decrypt(ct[0], ct[1], x)
+
+    @case("elgamal.check_subgroup", 3)
+    def _():
+        _, _, ct = sg_keys()
+        return lambda: elgamal.EG_check_ciphertext(ct[0], ct[1])
+
+    @case("elgamal.decrypt_tally_1M", 1)
+    def _():
+        x, y, _ = eg_keys()
+        table = elgamal.EG_log_table(10**6)
+        total = elgamal.EGA_encrypt(654321, y)
+        return lambda: elgamal.EGA_decrypt_tally(total[0], total[1], x, 10**6, table)
+
+    @case("ecelgamal.encrypt", 5)
+    def _():
+        _, P, _ = ec_keys()
+        return lambda: ecelgamal.ECEG_encrypt(1, P)
+
+    @case("ecelgamal.decrypt", 5)
+    def _():
+        x, _, ct = ec_keys()
+        return lambda: ecelgamal.ECEG_decrypt(ct[0], ct[1], x)
+
+    @case("ecelgamal.decrypt_tally_1M", 1)
+    def _():
+        G, _, _ = points()
+        x, P, _ = ec_keys()
+        table = ecelgamal.ECEG_log_table(10**6)
+        M = rfc7748.mult(654321, G[0], G[1], EC_P)
+        total = ecelgamal.ECEG_encrypt_precomputed(0, ecelgamal.ECEG_precompute(P))
+        total = (total[0], rfc7748.add(total[1][0], total[1][1], M[0], M[1], EC_P))
+        return lambda: ecelgamal.ECEG_decrypt_tally(total[0], total[1], x, 10**6, table)
+
+    return {name: measure(build(), repeat, number) for name, (build, number) in cases.items() if selected(name, only)}
+
+
+def election(sign_method: str, elgamal_method: str, voters: int, candidates: int) -> dict:
+    """Runs a full election and times each phase."""
+    names = [f"C{i + 1}" for i in range(candidates)]
+    timings = {}
+    start = time.perf_counter()
+    system = VoteSystem(Candidates(names), sign_method, elgamal_method)
+    timings["setup"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    keygen = ecdsa.ECDSA_generate_keys if sign_method == "el" else dsa.DSA_generate_keys
+    for i in range(voters):
+        x, y = keygen()
+        system.add_voter(Voter(f"v{i}", system.candidates, x, y))
+    timings["register"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(voters):
+        vote_list = [0] * candidates
+        vote_list[i % candidates] = 1
+        system.cast_vote(f"v{i}", vote_list)
+    timings["cast"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    system.tally_votes()
+    timings["tally"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    system.tally_votes(recount=True)
+    timings["recount"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    system.audit_ballots()
+    timings["audit"] = time.perf_counter() - start
+    return timings
+
+
+def macro_benchmarks(grid: list, only: str = None) -> dict:
+    results = {}
+    for sign_method, elgamal_method in (("default", "default"), ("default", "subgroup"), ("el", "el")):
+        for voters, candidates in grid:
+            name = f"election.{sign_method}-{elgamal_method}.{voters}x{candidates}"
+            if not any(selected(f"{name}.{phase}", only) for phase in PHASES):
+                continue
+            # cast_vote prints one line per ballot
+            with contextlib.redirect_stdout(io.StringIO()):
+                timings = election(sign_method, elgamal_method, voters, candidates)
+            for phase, seconds in timings.items():
+                if not selected(f"{name}.{phase}", only):
+                    continue
+                results[f"{name}.{phase}"] = {"min": seconds, "median": seconds, "repeat": 1, "number": 1}
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Returns (name, baseline, current, ratio) for every benchmark slower than baseline * (1 + threshold)."""
+    regressions = []
+    for name, current in results["benchmarks"].items():
+        previous = baseline["benchmarks"].get(name)
+        if previous is None:
+            continue
+        ratio = current["min"] / previous["min"] if previous["min"] else float("inf")
+        if ratio > 1 + threshold:
+            regressions.append((name, previous["min"], current["min"], ratio))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Crypto primitives and election benchmarks")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed slowdown before a regression is reported (default 0.2 = 20%%)")
+    parser.add_argument("--only", help="only run benchmarks whose name contains this string")
+    parser.add_argument("--quick", action="store_true", help="fewer repetitions and a smaller election grid")
+    parser.add_argument("--no-macro", action="store_true", help="skip the full-election benchmarks")
+    parser.add_argument("--no-import", action="store_true", help="skip the import-time benchmarks")
+    args = parser.parse_args(argv)
+
+    repeat = 3 if args.quick else 7
+    grid = [(10, 5), (50, 5)] if args.quick else [(10, 5), (100, 5), (100, 20), (500, 5)]
+
+    # --only filters the benchmarks before they run, not their results
+    benchmarks = {} if args.no_import else import_benchmarks(repeat, args.only)
+    benchmarks.update(micro_benchmarks(repeat, args.only))
+    if not args.no_macro:
+        benchmarks.update(macro_benchmarks(grid, args.only))
+
+    results = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "benchmarks": benchmarks,
+    }
+    for name, value in benchmarks.items():
+        print(f"{name:55s} {value['min'] * 1e3:12.3f} ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after, ratio in regressions:
+            print(f"REGRESSION {name}: {before * 1e3:.3f} ms -> {after * 1e3:.3f} ms (x{ratio:.2f})")
+        if regressions:
+            return 1
+        print("No regression.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+from math import isqrt
+from rfc7748 import add, mult
+import metrics
+from backend import powmod
+
+### baby-step/giant-step discrete logarithm, bounded to 0 <= k <= bound
+### the baby-step table is built once and can be reused for every candidate
+
+def _steps(bound: int) -> int:
+    # m baby steps and m+1 giant steps of stride m cover [0, m*m + m - 1] >= bound
+    return isqrt(max(bound, 0)) + 1
+
+
+class BabyGiantLog:
+    """
+    Solves h = g^k mod p for 0 <= k <= bound in O(sqrt(bound)) time and memory.
+    """
+    @metrics.instrumented("dlog.table")
+    def __init__(self, g: int, p: int, bound: int):
+        self.g = g
+        self.p = p
+        self.bound = bound
+        self.m = _steps(bound)
+
+        # Baby steps: g^j -> j for 0 <= j < m
+        self.table = {}
+        e = 1
+        for j in range(self.m):
+            self.table.setdefault(e, j)
+            e = (e * g) % p
+        # Giant stride: g^(-m)
+        self.stride = powmod(g, -self.m, p)
+
+    @metrics.instrumented("dlog.search")
+    def log(self, h: int) -> int:
+        h %= self.p
+        for i in range(self.m + 1):
+            j = self.table.get(h)
+            if j is not None and i * self.m + j <= self.bound:
+                return i * self.m + j
+            h = (h * self.stride) % self.p
+        raise ValueError(f"Total votes exceed {self.bound}")
+
+
+class ECBabyGiantLog:
+    """
+    Solves (u, v) = k * (BaseU, BaseV) for 0 <= k <= bound on Curve25519
+    in O(sqrt(bound)) time and memory. The point at infinity is (1, 0).
+    """
+    @metrics.instrumented("dlog.table")
+    def __init__(self, u: int, v: int, p: int, bound: int):
+        self.p = p
+        self.bound = bound
+        self.m = _steps(bound)
+
+        # Baby steps: j * Base -> j for 0 <= j < m
+        self.table = {}
+        current = (1, 0)
+        for j in range(self.m):
+            self.table.setdefault(current, j)
+            current = add(current[0], current[1], u, v, p)
+        # Giant stride: -(m * Base), added at each giant step
+        stride_u, stride_v = mult(self.m, u, v, p)
+        self.stride = (stride_u, (-stride_v) % p)
+
+    @metrics.instrumented("dlog.search")
+    def log(self, u: int, v: int) -> int:
+        current = (u % self.p, v % self.p) if (u, v) != (1, 0) else (1, 0)
+        for i in range(self.m + 1):
+            j = self.table.get(current)
+            if j is not None and i * self.m + j <= self.bound:
+                return i * self.m + j
+            current = add(current[0], current[1], self.stride[0], self.stride[1], self.p)
+        raise ValueError(f"Total votes exceed {self.bound}")
@@ -1,6 +1,9 @@
-from algebra import mod_inv
+from algebra import mod_inv, fixed_base_pow, pow2, multi_pow
 from Crypto.Hash import SHA256
-from random import randint
+from random import randint, getrandbits
+from backend import powmod
+from batch import find_invalid, outside_subgroup
+import metrics
 
 ## parameters from MODP Group 24 -- Extracted from RFC 5114
 
@@ -23,36 +26,45 @@ def DSA_generate_nonce(q: int = PARAM_Q) -> int:
 
 
 # Generate DSA keys (private and public)
+@metrics.instrumented("dsa.keygen")
 def DSA_generate_keys(p: int = PARAM_P,
                       q: int = PARAM_Q,
                       g: int = PARAM_G) -> tuple[int,int]:
     # Private key (x): random integer between 1 and q-1
     x = randint(1,q-1)
     # Public key (y): PARAM_G^x mod PARAM_P
-    y = pow(g,x,p)
+    y = fixed_base_pow(g,p).pow(x)
     return x,y
 
 
 # Sign a message using the DSA private key
+# With commit=True the full commitment R = g^k mod p is returned as a third
+# component, (r, s, R), which DSA_verify ignores and DSA_verify_batch uses.
+@metrics.instrumented("dsa.sign")
 def DSA_sign(message: bytes,
              x: int,
              p: int = PARAM_P,
              q: int = PARAM_Q,
-             g: int = PARAM_G) -> tuple[int, int]:
+             g: int = PARAM_G,
+             commit: bool = False) -> tuple[int, int]:
 
     # Generate a random nonce (k)
     k = DSA_generate_nonce(q)
     # Compute r = (PARAM_G^k mod PARAM_P) mod PARAM_Q
-    r = pow(g, k, p) % q
+    R = fixed_base_pow(g, p).pow(k)
+    r = R % q
     # Compute s = (H(message) + x * r) * mod_inv(k, PARAM_Q) mod PARAM_Q
     hm = H(message)
     k_inv = mod_inv(k, q)
     s = (k_inv * (hm + x * r)) % q
+    if commit:
+        return r, s, R
     return r, s  # Return integers, not hex strings
 
 
 
 # Verify a DSA signature
+@metrics.instrumented("dsa.verify")
 def DSA_verify(message: bytes,
                r: int,
                s: int,
@@ -72,14 +84,67 @@ def DSA_verify(message: bytes,
     u1 = (hm * w) % q
     u2 = (r * w) % q
 
-    gu1 = pow(g,u1,p)
-    yu2 = pow(y,u2,p)
-    v = (gu1 * yu2) % p
+    # g^u1 * y^u2 mod p with a single chain of squarings
+    v = pow2(g,u1,y,u2,p)
     v = v %q
     # Signature is valid if v == r
     return (v == r)
 
 
+# Verify many DSA signatures at once
+#    - items: list of (message, signature, y)
+# r is reduced mod q, so g^k cannot be rebuilt from (r, s): only signatures
+# carrying their commitment, (r, s, R) from DSA_sign(commit=True), are
+# combined; the others are checked one by one with DSA_verify.
+# The combined check is prod(R_i^(z_i*s_i)) == g^(sum z_i*H(m_i)) * prod(y_i^(z_i*r_i))
+# for random 128-bit z_i. Every R_i and y_i must lie in the order-q subgroup
+# (x^q == 1): a small-order factor such as -1 would only cancel out for some z_i,
+# letting an invalid signature through the combined check. Membership is checked
+# once for all the R_i and y_i (see batch.outside_subgroup), not at each bisection level.
+# Returns the indices of the invalid signatures (empty if all are valid).
+@metrics.instrumented("dsa.verify_batch")
+def DSA_verify_batch(items: list,
+                     p: int = PARAM_P,
+                     q: int = PARAM_Q,
+                     g: int = PARAM_G) -> list[int]:
+    def check_one(item):
+        message, signature, y = item
+        return DSA_verify(message, signature[0], signature[1], y, p, q, g)
+
+    def in_subgroup(x):
+        return powmod(x, q, p) == 1
+
+    def product(elements):
+        result = 1
+        for x in elements:
+            result = result * x % p
+        return result
+
+    def check_batch(batch):
+        g_exp = 0
+        lhs_bases, lhs_exps = [], []
+        rhs = {}
+        for message, (r, s, R), y in batch:
+            if not (0 < r < q and 0 < s < q and 0 < R < p and R % q == r):
+                return False
+            if R in outside or y in outside:
+                return False
+            z = getrandbits(128) | 1
+            lhs_bases.append(R)
+            lhs_exps.append(z * s % q)
+            g_exp = (g_exp + z * H(message)) % q
+            rhs[y] = (rhs.get(y, 0) + z * r) % q
+        rhs[g] = (rhs.get(g, 0) + g_exp) % q
+        return multi_pow(lhs_bases, lhs_exps, p) == multi_pow(list(rhs.keys()), list(rhs.values()), p)
+
+    committed = [i for i, (_, signature, _) in enumerate(items) if len(signature) >= 3]
+    elements = [x for i in committed for x in (items[i][1][2], items[i][2]) if 0 < x < p]
+    outside = outside_subgroup(elements, product, in_subgroup)
+    invalid = [i for i, item in enumerate(items) if len(item[1]) < 3 and not check_one(item)]
+    invalid += [committed[j] for j in find_invalid([items[i] for i in committed], check_batch, check_one)]
+    return sorted(invalid)
+
+
 if __name__ == "__main__":
     msg = b"An important message !"
     x = 0x49582493d17932dabd014bb712fc55af453ebfb2767537007b0ccff6e857e6a3
@@ -91,7 +156,7 @@ if __name__ == "__main__":
              g: int = PARAM_G) -> tuple[hex,hex]:
 
         k = 0x7e7f77278fe5232f30056200582ab6e7cae23992bca75929573b779c62ef4759 # k constant for testing
-        r = pow(g,k,p) % q
+        r = powmod(g,k,p) % q
         hm = H(message)
         k_inv = mod_inv(k,q)
         s = (k_inv * (hm + x *r)) % q
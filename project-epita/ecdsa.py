@@ -1,14 +1,18 @@
-from rfc7748 import x25519, add, computeVcoordinate, mult
+from rfc7748 import x25519, mult, mult2, multi_mult, sum_points, fixed_base, recoverVcoordinate, BASE_U, BASE_V
 from Crypto.Hash import SHA256
-from random import randint
+from random import randint, getrandbits
 from algebra import mod_inv
 from typing import Tuple
+from batch import find_invalid, outside_subgroup
+import metrics
 
 p = 2**255 - 19
 ORDER = (2**252 + 27742317777372353535851937790883648493)
 
-BaseU = 9
-BaseV = computeVcoordinate(BaseU)
+BaseU = BASE_U
+BaseV = BASE_V
+# Precomputed multiples of the base point, built on first use
+BASE = fixed_base(BaseU, BaseV, p)
 
 
 def H(message):
@@ -20,31 +24,41 @@ def ECDSA_generate_nonce() -> int:
     return randint(1, ORDER - 1)
 
 # Generate ECDSA key pair (private key x, public key P).
+@metrics.instrumented("ecdsa.keygen")
 def ECDSA_generate_keys() -> Tuple[int, Tuple[int, int]]:
     x = randint(1, ORDER - 1)  # Private key
     # Use mult to compute the public key: P = x * BasePoint
-    P = mult(x, BaseU, BaseV, p)  # Pass BaseU, BaseV, and p
+    P = BASE.mult(x)
     return x, P
 
 
 # Sign a message using the private key x.
 # - message: The message to sign (string).
 # - x: The private key (integer).
+# - commit: also return the u-coordinate of R, (r, s, u), for ECDSA_verify_batch.
 # Returns the signature (r, s).
-def ECDSA_sign(message: bytes, x: int) -> Tuple[int, int]:
+@metrics.instrumented("ecdsa.sign")
+def ECDSA_sign(message: bytes, x: int, commit: bool = False) -> Tuple[int, int]:
     # Step 1: Generate a random nonce k
     k = ECDSA_generate_nonce()
     # Step 2: Compute R = k * BasePoint
-    R = mult(k, BaseU, BaseV, p)  # Pass BaseU, BaseV, and p
+    R = BASE.mult(k)
+    # Use -k when R has an odd v-coordinate: R keeps its u-coordinate, and
+    # the verifier can rebuild R from u alone (needed for batch verification)
+    if R[1] & 1:
+        k = ORDER - k
+        R = (R[0], p - R[1])
     r = R[0] % ORDER  # r = x-coordinate of R modulo ORDER
     if r == 0:
-        return ECDSA_sign(message, x)  # Retry if r == 0
+        return ECDSA_sign(message, x, commit)  # Retry if r == 0
     # Step 3: Compute s = k^(-1) * (H(m) + r * x) mod ORDER
     k_inv = mod_inv(k, ORDER)
     h = H(message)
     s = (k_inv * (h + r * x)) % ORDER
     if s == 0:
-        return ECDSA_sign(message, x)  # Retry if s == 0
+        return ECDSA_sign(message, x, commit)  # Retry if s == 0
+    if commit:
+        return r, s, R[0]
     return r, s    
 
 # Verify an ECDSA signature.
@@ -52,6 +66,7 @@ def ECDSA_sign(message: bytes, x: int) -> Tuple[int, int]:
 #    - r, s: The signature components (integers).
 #    - P: The public key (tuple of two integers).
 #    Returns True if the signature is valid, False otherwise.
+@metrics.instrumented("ecdsa.verify")
 def ECDSA_verify(message: bytes, r: int, s: int, P: Tuple[int, int]) -> bool:
     if not (1 <= r < ORDER and 1 <= s < ORDER):
         return False  # Invalid signature
@@ -61,16 +76,73 @@ def ECDSA_verify(message: bytes, r: int, s: int, P: Tuple[int, int]) -> bool:
     h = H(message)
     u1 = (h * w) % ORDER
     u2 = (r * w) % ORDER
-    # Step 3: Compute R' = u1 * BasePoint + u2 * P
-    u1_x, u1_y = mult(u1, BaseU, BaseV, p)  # Compute u1 * BasePoint
-    u2_x, u2_y = mult(u2, P[0], P[1], p)   # Compute u2 * P
-    R_prime_x, R_prime_y = add(u1_x, u1_y, u2_x, u2_y, p)  # Add the two points
+    # Step 3: Compute R' = u1 * BasePoint + u2 * P in one joint multiplication
+    R_prime_x, R_prime_y = mult2(u1, BaseU, BaseV, u2, P[0], P[1], p)
     if (R_prime_x, R_prime_y) == (1, 0):  # Point at infinity
         return False
     # Step 4: Check if r == x-coordinate of R' mod ORDER
     return r == (R_prime_x % ORDER)
 
 
+# Rebuild R = (u, v) with an even v-coordinate, as produced by ECDSA_sign.
+# Returns None if u is not the u-coordinate of a curve point.
+def ECDSA_recover_R(u: int):
+    v = recoverVcoordinate(u, 0)
+    if v is None:
+        return None
+    return (u, v)
+
+# True if P lies in the prime-order subgroup, i.e. carries no 2-, 4- or 8-torsion part
+def in_subgroup(P: Tuple[int, int]) -> bool:
+    return mult(ORDER, P[0], P[1], p) == (1, 0)
+
+# Verify many ECDSA signatures at once.
+#    - items: list of (message, signature, P).
+#    r only keeps R's u-coordinate modulo ORDER, so R can only be rebuilt for
+#    signatures carrying it, (r, s, u) from ECDSA_sign(commit=True); the
+#    others are checked one by one with ECDSA_verify.
+#    The combined check is sum(z_i * (s_i * R_i - H(m_i) * G - r_i * P_i)) == 0
+#    for random 128-bit z_i, with one multi-scalar multiplication; on failure
+#    the batch is bisected to find the bad signatures. The cofactor is 8, so
+#    every R_i and P_i must lie in the prime-order subgroup: a torsion part
+#    would only cancel out for some z_i and let an invalid signature through.
+#    Membership is checked once for all the R_i and P_i (see
+#    batch.outside_subgroup), not at each bisection level.
+#    Returns the indices of the invalid signatures (empty if all are valid).
+@metrics.instrumented("ecdsa.verify_batch")
+def ECDSA_verify_batch(items: list) -> list[int]:
+    def check_one(item):
+        message, signature, P = item
+        return ECDSA_verify(message, signature[0], signature[1], P)
+
+    def check_batch(batch):
+        g_coeff = 0
+        coeffs = {}
+        for message, (r, s, u), P in batch:
+            if not (1 <= r < ORDER and 1 <= s < ORDER and 0 <= u < p and u % ORDER == r):
+                return False
+            R = commitments[u]
+            if R is None or R in outside or (P[0] % p, P[1] % p) in outside:
+                return False
+            z = getrandbits(128) | 1
+            g_coeff = (g_coeff + z * H(message)) % ORDER
+            coeffs[R] = (coeffs.get(R, 0) + z * s) % ORDER
+            minus_P = (P[0] % p, (-P[1]) % p)
+            coeffs[minus_P] = (coeffs.get(minus_P, 0) + z * r) % ORDER
+        minus_G = (BaseU, p - BaseV)
+        coeffs[minus_G] = (coeffs.get(minus_G, 0) + g_coeff) % ORDER
+        return multi_mult(list(coeffs.values()), list(coeffs.keys()), p) == (1, 0)
+
+    committed = [i for i, (_, signature, _) in enumerate(items) if len(signature) >= 3]
+    # R is rebuilt once per commitment, whatever the bisection depth
+    commitments = {u: ECDSA_recover_R(u) for u in {items[i][1][2] for i in committed} if 0 <= u < p}
+    elements = [R for R in commitments.values() if R is not None]
+    elements += [(items[i][2][0] % p, items[i][2][1] % p) for i in committed]
+    outside = outside_subgroup(elements, lambda points: sum_points(points, p), in_subgroup)
+    invalid = [i for i, item in enumerate(items) if len(item[1]) < 3 and not check_one(item)]
+    invalid += [committed[j] for j in find_invalid([items[i] for i in committed], check_batch, check_one)]
+    return sorted(invalid)
+
 if __name__ == "__main__":
     # TEST
     m = b"A very very important message !"  # Message to sign
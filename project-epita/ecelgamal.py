@@ -1,14 +1,18 @@
-from rfc7748 import x25519, add, sub, computeVcoordinate, mult
+from rfc7748 import x25519, add, sub, mult, fixed_base, FixedBase, BASE_U, BASE_V
 from algebra import mod_inv, int_to_bytes
 from random import randint
 from typing import Tuple
+from dlog import ECBabyGiantLog
+import metrics
 # from algebra import bruteLog
 
 p = 2**255 - 19
 ORDER = (2**252 + 27742317777372353535851937790883648493)
 
-BaseU = 9
-BaseV = computeVcoordinate(BaseU)
+BaseU = BASE_U
+BaseV = BASE_V
+# Precomputed multiples of the base point, built on first use
+BASE = fixed_base(BaseU, BaseV, p)
 
 def bruteECLog(C1, C2, max_attempts):
     """Find k such that k * BasePoint = (C1, C2) by brute-forcing up to max_attempts."""
@@ -19,19 +23,29 @@ def bruteECLog(C1, C2, max_attempts):
         current = add(current[0], current[1], BaseU, BaseV, p)
     raise ValueError(f"Total votes exceed {max_attempts}")
 
-def ECEG_decrypt_tally(R: Tuple[int, int], C: Tuple[int, int], x: int, max_voters: int) -> int:
-    """Decrypt for tallying by brute-forcing up to max_voters."""
+def ECEG_log_table(max_voters: int) -> ECBabyGiantLog:
+    """Baby-step/giant-step table for totals in [0, max_voters], shared across candidates."""
+    return ECBabyGiantLog(BaseU, BaseV, p, max_voters)
+
+@metrics.instrumented("ecelgamal.decrypt_tally")
+def ECEG_decrypt_tally(R: Tuple[int, int], C: Tuple[int, int], x: int, max_voters: int,
+                       table: ECBabyGiantLog = None) -> int:
+    """Decrypt for tallying with a baby-step/giant-step search up to max_voters."""
     S = mult(x, R[0], R[1], p)
     M = sub(C[0], C[1], S[0], S[1], p)
-    return bruteECLog(M[0], M[1], max_voters)
+    if table is None or table.bound < max_voters:
+        table = ECEG_log_table(max_voters)
+    return table.log(M[0], M[1])
 
 def EGencode(message: int) -> Tuple[int, int]:
     if message == 0:
         return (1, 0)  # Point at infinity for 0
     elif message == 1:
         return (BaseU, BaseV)  # Base point for 1
+    elif message > 1:
+        return BASE.mult(message)  # Packed ballots (see packing.py)
     else:
-        raise ValueError("Invalid message (must be 0 or 1)")
+        raise ValueError("Invalid message (must be a non-negative integer)")
 
 def EGdecode(M: Tuple[int, int]) -> int:
     if M == (1, 0):
@@ -44,9 +58,10 @@ def EGdecode(M: Tuple[int, int]) -> int:
 
 # Generate EC ElGamal key pair.
 #     - Returns: private key (x), public key (P = x * BasePoint).
+@metrics.instrumented("ecelgamal.keygen")
 def ECEG_generate_keys() -> Tuple[int, Tuple[int, int]]:
     x = randint(1, ORDER - 1)  # Private key
-    P = mult(x, BaseU, BaseV, p)  # Public key: P = x * BasePoint
+    P = BASE.mult(x)  # Public key: P = x * BasePoint
     return x, P
 
 
@@ -57,11 +72,26 @@ def ECEG_generate_keys() -> Tuple[int, Tuple[int, int]]:
 #         - R = k * BasePoint
 #         - C = M + k * P
 
+@metrics.instrumented("ecelgamal.encrypt")
 def ECEG_encrypt(message: int, P: Tuple[int, int]) -> Tuple[Tuple[int, int], Tuple[int, int]]:
-    M = EGencode(message)
+    return ECEG_encrypt_precomputed(message, ECEG_precompute(P))
+
+
+# Message-independent part of ECEG_encrypt.
+#     - P_table (optional): FixedBase table for the public key P.
+#     - Returns: (k * BasePoint, k * P) for a fresh random k.
+@metrics.instrumented("ecelgamal.precompute")
+def ECEG_precompute(P: Tuple[int, int], P_table: FixedBase = None) -> Tuple[Tuple[int, int], Tuple[int, int]]:
     k = randint(1, ORDER - 1)
-    R = mult(k, BaseU, BaseV, p)
-    kP = mult(k, P[0], P[1], p)
+    R = BASE.mult(k)
+    kP = P_table.mult(k) if P_table is not None else mult(k, P[0], P[1], p)
+    return R, kP
+
+
+# Finish ECEG_encrypt from a precomputed pair (k * BasePoint, k * P): one point addition.
+def ECEG_encrypt_precomputed(message: int, pair) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+    M = EGencode(message)
+    R, kP = pair
     C = add(M[0], M[1], kP[0], kP[1], p)
     return R, C
 
@@ -71,6 +101,7 @@ def ECEG_encrypt(message: int, P: Tuple[int, int]) -> Tuple[Tuple[int, int], Tup
 #    - C: The C component of the ciphertext (tuple of two integers).
 #    - x: The private key of the recipient.
 #    - Returns: The decoded message (0 or 1).
+@metrics.instrumented("ecelgamal.decrypt")
 def ECEG_decrypt(R: Tuple[int, int], C: Tuple[int, int], x: int) -> int:
     # Compute S = x * R
     S = mult(x, R[0], R[1], p)
@@ -0,0 +1,219 @@
+### Edwards25519 backend for the Curve25519 group
+###
+### -x^2 + y^2 = 1 + d x^2 y^2 is birationally equivalent to the Montgomery curve
+### v^2 = u^3 + A u^2 + u used everywhere else (RFC 7748, section 4.1):
+###   (x, y) = (c u / v, (u - 1) / (u + 1))    (u, v) = ((1 + y) / (1 - y), c u / x)
+### with c = sqrt(-(A + 2)). The point at infinity (1, 0) maps to the neutral
+### element (0, 1) and the 2-torsion point (0, 0) to (0, -1).
+###
+### Points are kept in extended coordinates (X : Y : Z : T), x = X/Z, y = Y/Z,
+### T = XY/Z. Since d is not a square the addition formulas are complete:
+### the same branch-free code adds, doubles and handles the neutral element,
+### and no inversion is needed until the result goes back to Montgomery form.
+
+from algebra import batch_inv
+import metrics
+
+p = 2**255 - 19
+A = 486662
+# d = -121665/121666 and c = sqrt(-(A + 2)), hard-coded and checked below
+D = 37095705934669439343138083508754565189542113879843219016388785533085940283555
+D2 = 2 * D % p
+C = 6853475219497561581579357271197624642482790079785650197046958215289687604742
+
+if (D * 121666 + 121665) % p != 0 or (C * C + A + 2) % p != 0:
+    raise Exception("Invalid Edwards25519 constants")
+
+IDENTITY = (0, 1, 1, 0)
+
+
+### conversions at the API boundary
+
+def from_montgomery(u: int, v: int):
+    """Extended Edwards point of the Montgomery point (u, v), without inversion."""
+    if (u, v) == (1, 0):
+        return IDENTITY
+    u, v = u % p, v % p
+    if u == 0:
+        return (0, p - 1, 1, 0)
+    # x = c u / v and y = (u - 1) / (u + 1) over the common denominator Z = v (u + 1)
+    return (C * u * (u + 1) % p, (u - 1) * v % p, v * (u + 1) % p, C * u * (u - 1) % p)
+
+def to_montgomery(P) -> tuple:
+    """Affine Montgomery point (u, v) of an extended Edwards point, one inversion."""
+    return to_montgomery_many([P])[0]
+
+def to_montgomery_proj(P) -> tuple:
+    """Projective Montgomery point (U : V : W), u = U/W and v = V/W, without inversion."""
+    X, Y, Z, _ = P
+    if X % p == 0:
+        return (0, 1, 0) if (Y - Z) % p == 0 else (0, 0, 1)
+    # u = (Z + Y) / (Z - Y) and v = c (Z + Y) Z / ((Z - Y) X)
+    return ((Z + Y) * X % p, C * (Z + Y) * Z % p, (Z - Y) * X % p)
+
+def to_montgomery_many(points) -> list:
+    """Converts many points back to Montgomery form sharing a single inversion."""
+    results = [None] * len(points)
+    indices, denominators = [], []
+    for i, (X, Y, Z, _) in enumerate(points):
+        X, Y, Z = X % p, Y % p, Z % p
+        if X == 0:
+            # y = 1 is the neutral element, y = -1 the 2-torsion point (0, 0)
+            results[i] = (1, 0) if Y == Z else (0, 0)
+        else:
+            indices.append(i)
+            denominators.append((Z - Y) * X % p)
+    for i, inv in zip(indices, batch_inv(denominators, p) if denominators else []):
+        X, Y, Z, _ = points[i]
+        # u = (Z + Y) / (Z - Y) and v = c u / x = c (Z + Y) Z / ((Z - Y) X)
+        results[i] = ((Z + Y) * X * inv % p, C * (Z + Y) * Z * inv % p)
+    return results
+
+
+### group law (Hisil-Wong-Carter-Dawson, a = -1)
+
+def add(P, Q):
+    X1, Y1, Z1, T1 = P
+    X2, Y2, Z2, T2 = Q
+    a = (Y1 - X1) * (Y2 - X2) % p
+    b = (Y1 + X1) * (Y2 + X2) % p
+    c = T1 * D2 * T2 % p
+    d = Z1 * 2 * Z2 % p
+    e, f, g, h = b - a, d - c, d + c, b + a
+    return (e * f % p, g * h % p, f * g % p, e * h % p)
+
+def double(P):
+    X1, Y1, Z1, _ = P
+    a = X1 * X1 % p
+    b = Y1 * Y1 % p
+    c = 2 * Z1 * Z1 % p
+    h = a + b
+    e = h - (X1 + Y1) * (X1 + Y1) % p
+    g = a - b
+    f = c + g
+    return (e * f % p, g * h % p, f * g % p, e * h % p)
+
+def neg(P):
+    X, Y, Z, T = P
+    return (-X % p, Y, Z, -T % p)
+
+
+### mixed addition with a precomputed affine point (y + x, y - x, 2 d x y)
+
+def _niels_many(points) -> list:
+    results = []
+    for (X, Y, Z, T), z_inv in zip(points, batch_inv([Z for _, _, Z, _ in points], p)):
+        x, y = X * z_inv % p, Y * z_inv % p
+        results.append(((y + x) % p, (y - x) % p, D2 * x * y % p))
+    return results
+
+def _add_niels(P, N):
+    X1, Y1, Z1, T1 = P
+    ypx, ymx, xy2d = N
+    a = (Y1 - X1) * ymx % p
+    b = (Y1 + X1) * ypx % p
+    c = T1 * xy2d % p
+    d = 2 * Z1
+    e, f, g, h = b - a, d - c, d + c, b + a
+    return (e * f % p, g * h % p, f * g % p, e * h % p)
+
+
+### scalar multiplication, 4-bit fixed windows
+
+def mult(n: int, P):
+    if metrics.ENABLED:
+        metrics.count("scalar_mult_edwards")
+    if n < 0:
+        n, P = -n, neg(P)
+    table = [IDENTITY, P]
+    for _ in range(14):
+        table.append(add(table[-1], P))
+    T = IDENTITY
+    for shift in range(((n.bit_length() + 3) // 4 - 1) * 4, -1, -4):
+        T = double(double(double(double(T))))
+        T = add(T, table[(n >> shift) & 15])
+    return T
+
+def mult2(n1: int, P1, n2: int, P2):
+    """n1*P1 + n2*P2 with one shared chain of doublings (Straus, 2-bit windows)."""
+    if metrics.ENABLED:
+        metrics.count("scalar_mult_double")
+    row = [IDENTITY]
+    for _ in range(3):
+        row.append(add(row[-1], P1))
+    table = [row]
+    for _ in range(3):
+        table.append([add(T, P2) for T in table[-1]])
+    n = max(n1.bit_length(), n2.bit_length())
+    T = IDENTITY
+    for shift in range(((n + 1) // 2 - 1) * 2, -1, -2):
+        T = add(double(double(T)), table[(n2 >> shift) & 3][(n1 >> shift) & 3])
+    return T
+
+def multi_mult(scalars, points):
+    """sum(n_i * P_i) with Pippenger's bucket method."""
+    if metrics.ENABLED:
+        metrics.count("scalar_mult_multi")
+    n = len(points)
+    T = IDENTITY
+    if n == 0:
+        return T
+    c = min(max(2, n.bit_length() - 2), 16)
+    mask = 2**c - 1
+    bits = max(k.bit_length() for k in scalars)
+    for shift in range(((bits + c - 1) // c - 1) * c, -1, -c):
+        for _ in range(c):
+            T = double(T)
+        buckets = [IDENTITY] * (mask + 1)
+        for k, P in zip(scalars, points):
+            d = (k >> shift) & mask
+            if d:
+                buckets[d] = add(buckets[d], P)
+        running, acc = IDENTITY, IDENTITY
+        for d in range(mask, 0, -1):
+            running = add(running, buckets[d])
+            acc = add(acc, running)
+        T = add(T, acc)
+    return T
+
+### fixed-base scalar multiplication
+### table[i][d-1] = d * 16^i * B in precomputed affine form, built on first use
+
+class FixedBase:
+    def __init__(self, P, bits: int = 256, w: int = 4):
+        self.P = P
+        self.bits = bits
+        self.w = w
+        self.table = None
+
+    def _build(self):
+        size = 2**self.w - 1
+        rows = []
+        base = self.P
+        for _ in range((self.bits + self.w - 1) // self.w):
+            row = [base]
+            for _ in range(size - 1):
+                row.append(add(row[-1], base))
+            rows.append(row)
+            base = add(row[-1], base)
+        flat = _niels_many([Q for row in rows for Q in row])
+        # Published only once complete, the table may be shared between threads
+        self.table = [flat[i:i + size] for i in range(0, len(flat), size)]
+
+    def mult(self, n: int):
+        if metrics.ENABLED:
+            metrics.count("scalar_mult_base")
+        if n < 0 or n.bit_length() > self.bits:
+            return mult(n, self.P)
+        if self.table is None:
+            self._build()
+        mask = 2**self.w - 1
+        T = IDENTITY
+        i = 0
+        while n:
+            d = n & mask
+            if d:
+                T = _add_niels(T, self.table[i][d - 1])
+            n >>= self.w
+            i += 1
+        return T
@@ -0,0 +1,137 @@
+### multi-race elections: one ballot holds several races (referendums, local offices...)
+###
+### An Election is a VoteSystem over the candidates of every race laid end to end,
+### so the races share the election key, the fixed-base tables of the encryption,
+### the voter registry, the ballot log and the running totals. A ballot is a single
+### signed message with the ciphertexts of all the races; a race left out is
+### encrypted as an abstention (all zeros). With packed=N the votes of each race are
+### packed into as few ciphertexts as the range allows (see packing.py).
+###
+### The discrete-log tables are built per bound and kept in an LRU cache of
+### cache_size tables, shared by every race whose bound rounds to the same size.
+
+from collections import OrderedDict
+from typing import Union
+from candidate import Candidates
+from voters import Voter
+from vote_system import VoteSystem, decrypt_total
+from packing import BallotLayout
+import elgamal
+import ecelgamal
+import metrics
+
+
+class Race:
+    def __init__(self, name: str, candidates: Candidates, start: int):
+        """start: index of the race's first candidate in the ballot"""
+        self.name = name
+        self.candidates = candidates
+        self.start = start
+
+    @property
+    def stop(self) -> int:
+        return self.start + self.candidates.candidate_number
+
+
+class LRUCache:
+    """At most maxsize values, the least recently used one is dropped first."""
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        """Value cached for key, build() on a miss."""
+        if key in self.values:
+            self.hits += 1
+            self.values.move_to_end(key)
+            return self.values[key]
+        self.misses += 1
+        value = build()
+        self.values[key] = value
+        if len(self.values) > self.maxsize:
+            self.values.popitem(last=False)
+        return value
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class Election(VoteSystem):
+    def __init__(self, races: dict[str, Candidates], sign_method: str, elgamal_method: str,
+                 store_path: str = None, eg_keys: tuple = None, pool_size: int = 0, packed: int = None,
+                 cache_size: int = 4):
+        """
+        races: candidates of each race, in ballot order
+        cache_size: number of discrete-log tables kept between tallies
+        See VoteSystem for the other arguments.
+        """
+        self.races = {}
+        start = 0
+        for name, candidates in races.items():
+            self.races[name] = Race(name, candidates, start)
+            start += candidates.candidate_number
+        # Registered voters and tools such as registration.register_roster see every candidate
+        flat = Candidates([f"{name}/{c}" for name, candidates in races.items() for c in candidates.candidate_list])
+        self.log_tables = LRUCache(cache_size)
+        super().__init__(flat, sign_method, elgamal_method, store_path, eg_keys, pool_size, packed)
+
+    def ballot_layout(self, packed: int = None) -> BallotLayout:
+        """One group per race, packed ciphertexts never mix two races."""
+        return BallotLayout([race.candidates.candidate_number for race in self.races.values()], packed)
+
+    def _vote_list(self, voter_name: str, votes: dict[str, list[int]]) -> list[int]:
+        """The whole ballot's vote list, checking each race's votes."""
+        unknown = set(votes) - set(self.races)
+        if unknown:
+            raise Exception(f"Unknown race {sorted(unknown)[0]}!")
+        vote_list = [0] * self.candidates.candidate_number
+        for name, race_votes in votes.items():
+            race = self.races[name]
+            vote_list[race.start:race.stop] = Voter(voter_name, race.candidates, None, None).create_vote(race_votes)
+        return vote_list
+
+    @metrics.instrumented("phase.cast_vote")
+    def cast_vote(self, voter_name: str, votes: dict[str, list[int]]):
+        """votes: race name -> vote list, the races left out are abstentions"""
+        if self.voters_map.has_voted(voter_name):
+            raise Exception("Voter has already voted!")
+        vote_list = self._vote_list(voter_name, votes)
+        voter = self.voter(voter_name)
+        ciphertexts, ballot = self.vote_encryption.encrypt_and_sign(vote_list, voter.sign_key_x)
+        self._append_ballot(voter_name, ciphertexts, ballot)
+        print(f"Ballot from {voter_name} recorded.")
+
+    def log_table(self, max_voters: int):
+        # Bounds are rounded up to a power of two so that races of similar size share a table
+        bound = 1 << max(max_voters, 1).bit_length()
+        if self.elgamal_method == "el":
+            return self.log_tables.get(("el", bound), lambda: ecelgamal.ECEG_log_table(bound))
+        return self.log_tables.get(("default", bound), lambda: elgamal.EG_log_table(bound))
+
+    def tally_votes(self, max_voters: Union[int, dict[str, int]] = None, workers: int = None, recount: bool = False,
+                    checkpoint_path: str = None, checkpoint_every: int = 10000) -> dict:
+        """
+        Results of every race, {race: {candidate: votes}}.
+        max_voters bounds the discrete-log search, for all races or per race
+        ({race: bound}); defaults to the number of recorded ballots.
+        See VoteSystem.tally_votes for the other arguments, which apply to the
+        whole ballot: the races are recounted and checkpointed together.
+        """
+        return super().tally_votes(max_voters, workers, recount, checkpoint_path, checkpoint_every)
+
+    def _bounds(self, max_voters: Union[int, dict[str, int]] = None) -> list[int]:
+        races = list(self.races.values())
+        bounds = []
+        for i, (group, _, _) in enumerate(self.layout.chunks):
+            n = max_voters.get(races[group].name) if isinstance(max_voters, dict) else max_voters
+            bounds.append(self.layout.bound(i, len(self.ballots) if n is None else n))
+        return bounds
+
+    def _decrypt(self, aggregate: tuple, bound: int) -> int:
+        return decrypt_total(self.elgamal_method, aggregate, self.eg_x, bound, self.log_table(bound))
+
+    def _results(self, counts: list[int]) -> dict:
+        return {name: {candidate: counts[race.start + i] for i, candidate in enumerate(race.candidates.candidate_list)}
+                for name, race in self.races.items()}
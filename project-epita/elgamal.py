@@ -1,5 +1,8 @@
-from algebra import mod_inv, int_to_bytes
+from algebra import mod_inv, int_to_bytes, fixed_base_pow, FixedBasePow
 from random import randint
+from dlog import BabyGiantLog
+from backend import powmod
+import metrics
 
 PARAM_P = 0x87A8E61DB4B6663CFFBBD19C651959998CEEF608660DD0F25D2CEED4435E3B00E00DF8F1D61957D4FAF7DF4561B2AA3016C3D91134096FAA3BF4296D830E9A7C209E0C6497517ABD5A8A9D306BCF67ED91F9E6725B4758C022E0B1EF4275BF7B6C5BFC11D45F9088B941F54EB1E59BB8BC39A0BF12307F5C4FDB70C581B23F76B63ACAE1CAA6B7902D52526735488A0EF13C6D9A51BFA4AB3AD8347796524D8EF6A167B5A41825D967E144E5140564251CCACB83E6B486F6B3CA3F7971506026C0B857F689962856DED4010ABD0BE621C3A3960A54E710C375F26375D7014103A4B54330C198AF126116D2276E11715F693877FAD7EF09CADB094AE91E1A1597
 
@@ -20,18 +23,20 @@ def bruteLog(g, c, p):
             return i + 1
     return -1
 
-def EG_generate_keys(p:hex = PARAM_P, g: hex =PARAM_G) -> tuple[int,int]:
+@metrics.instrumented("elgamal.keygen")
+def EG_generate_keys(p:hex = PARAM_P, g: hex =PARAM_G, q: int = None) -> tuple[int,int]:
     """
     ElGamal Key Generation (Multiplicative version)
+    q (optional): order of g, the secret key is then a short exponent below q
     
     Returns:
-        x (int): secret key (1 <= x <= p-2)
+        x (int): secret key (1 <= x <= p-2, or 1 <= x <= q-1)
         y (int): public key = g^x mod p
     """
     # Private key
-    x = randint(1, p-2)
+    x = randint(1, q-1) if q else randint(1, p-2)
     # Public key
-    y = pow(g, x, p)
+    y = fixed_base_pow(g, p).pow(x)
     return x, y
 
 
@@ -50,33 +55,56 @@ def EGM_encrypt(M: int, y: int, p=PARAM_P, g=PARAM_G)->tuple[int,int]:
     k = randint(1, p-2)
     
     # c1 = g^k mod p
-    c1 = pow(g, k, p)
+    c1 = powmod(g, k, p)
     
     # c2 = M * (y^k mod p) mod p
-    s = pow(y, k, p)  # shared secret
+    s = powmod(y, k, p)  # shared secret
     c2 = (M * s) % p
     
     return c1, c2
 
 
 ## additive version
-def EGA_encrypt(M: int, y: int, p=PARAM_P, g=PARAM_G) -> tuple[int,int]:
+@metrics.instrumented("elgamal.encrypt")
+def EGA_encrypt(M: int, y: int, p=PARAM_P, g=PARAM_G, y_pow: FixedBasePow = None,
+                q: int = None) -> tuple[int,int]:
     """
     (Optional) Additive version of ElGamal Encryption
     If you want an additive homomorphic scheme, you'd define a different group operation.
     We'll just put a placeholder to illustrate.
+    y_pow (optional): precomputed FixedBasePow table for the public key y
+    q (optional): order of g, the ephemeral exponent is then drawn below q
     """
     # For an additive version, you'd have a different group law, but let's keep
     # the same pattern. This is just a placeholder.
-    
-    k = randint(1, p-2)
-    c1 = pow(g, k, p)  # or "g*k mod p" for an additive group
-    s = pow(y, k, p)
+    return EGA_encrypt_precomputed(M, EGA_precompute(y, p, g, y_pow, q), p, g)
+
+
+@metrics.instrumented("elgamal.precompute")
+def EGA_precompute(y: int, p=PARAM_P, g=PARAM_G, y_pow: FixedBasePow = None,
+                   q: int = None) -> tuple[int,int]:
+    """
+    Message-independent part of EGA_encrypt
+    Returns:
+        (g^k, y^k) for a fresh random k (k < q if q is given)
+    """
+    k = randint(1, q-1) if q else randint(1, p-2)
+    c1 = fixed_base_pow(g, p).pow(k)  # or "g*k mod p" for an additive group
+    s = y_pow.pow(k) if y_pow is not None else powmod(y, k, p)
+    return c1, s
+
+
+def EGA_encrypt_precomputed(M: int, pair: tuple[int,int], p=PARAM_P, g=PARAM_G) -> tuple[int,int]:
+    """
+    Finishes EGA_encrypt from a precomputed pair (g^k, y^k)
+    """
+    c1, s = pair
     # c2 = (M + s) mod p for an additive scheme, for instance
-    c2 = (pow(g,M,p)*s) % p
+    c2 = (fixed_base_pow(g, p).pow(M)*s) % p
     return c1, c2
 
 
+@metrics.instrumented("elgamal.decrypt")
 def EG_decrypt(c1: int, c2: int, x: int, p=PARAM_P) -> int:
     """
     ElGamal Decryption (Multiplicative version)
@@ -87,7 +115,7 @@ def EG_decrypt(c1: int, c2: int, x: int, p=PARAM_P) -> int:
         M (int): plaintext in [1, p-1]
     """
     # s = c1^x mod p
-    s = pow(c1, x, p)
+    s = powmod(c1, x, p)
     
     # M = c2 * s^-1 mod p
     s_inv = mod_inv(s, p)
@@ -95,6 +123,39 @@ def EG_decrypt(c1: int, c2: int, x: int, p=PARAM_P) -> int:
     return M
 
 
+### order-q subgroup
+### g = PARAM_G generates the subgroup of order PARAM_Q (RFC 5114), so keys and
+### ephemeral exponents can be drawn below q: 256-bit instead of 2048-bit exponents.
+### p - 1 = 2 * 7 * 13 * ... * q has small factors, hence the membership check
+### of every ciphertext received in this mode.
+
+def EG_in_subgroup(c: int, p=PARAM_P, q=PARAM_Q) -> bool:
+    return 1 <= c < p and powmod(c, q, p) == 1
+
+def EG_check_ciphertext(c1: int, c2: int, p=PARAM_P, q=PARAM_Q):
+    """Raises ValueError unless both components lie in the order-q subgroup."""
+    if not (EG_in_subgroup(c1, p, q) and EG_in_subgroup(c2, p, q)):
+        raise ValueError("Invalid ciphertext: not in the order-q subgroup")
+
+
+def EG_log_table(max_voters: int, p=PARAM_P, g=PARAM_G) -> BabyGiantLog:
+    """Baby-step/giant-step table for totals in [0, max_voters], shared across candidates."""
+    return BabyGiantLog(g, p, max_voters)
+
+
+@metrics.instrumented("elgamal.decrypt_tally")
+def EGA_decrypt_tally(c1: int, c2: int, x: int, max_voters: int,
+                      table: BabyGiantLog = None, p=PARAM_P, g=PARAM_G) -> int:
+    """
+    Additive ElGamal decryption for tallying
+    Recovers M from g^M with a baby-step/giant-step search, 0 <= M <= max_voters.
+    """
+    gM = EG_decrypt(c1, c2, x, p)
+    if table is None or table.bound < max_voters:
+        table = EG_log_table(max_voters, p, g)
+    return table.log(gM)
+
+
 
 if __name__ == "__main__":
     # m1 = 0x2661b673f687c5c3142f806d500d2ce57b1182c9b25bfe4fa09529424b
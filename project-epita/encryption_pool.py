@@ -0,0 +1,100 @@
+### pool of precomputed encryption randomness for the election key
+### ElGamal: (g^k, y^k); EC ElGamal: (k * BasePoint, k * P)
+### a background thread keeps the pool filled, so casting a ballot only
+### costs one group operation per candidate
+
+import threading
+from collections import deque
+from typing import Tuple, Union
+from algebra import FixedBasePow
+from rfc7748 import FixedBase
+import elgamal
+import ecelgamal
+
+
+class EncryptionPool:
+    def __init__(self, elgamal_method: str, eg_pu_key: Union[int, Tuple[int, int]],
+                 size: int = 256, start: bool = True):
+        self.elgamal_method = elgamal_method
+        self.eg_pu_key = eg_pu_key
+        self.size = size
+        self.pairs = deque()
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+
+        # Short exponents below q in the subgroup mode
+        self.q = q = elgamal.PARAM_Q if elgamal_method == "subgroup" else None
+        # Fixed-base table for the election key, shared by every precomputation and
+        # built by whichever thread uses it first, so it is only published once complete
+        if elgamal_method == "el":
+            self.pu_table = FixedBase(eg_pu_key[0], eg_pu_key[1], ecelgamal.p)
+        else:
+            self.pu_table = FixedBasePow(eg_pu_key, elgamal.PARAM_P, q.bit_length() if q else None)
+
+        if start:
+            self.start()
+
+    def precompute(self):
+        if self.elgamal_method == "el":
+            return ecelgamal.ECEG_precompute(self.eg_pu_key, self.pu_table)
+        return elgamal.EGA_precompute(self.eg_pu_key, y_pow=self.pu_table, q=self.q)
+
+    def fill(self, count: int = None):
+        """Synchronously adds count pairs (default: up to the pool size)."""
+        if count is None:
+            count = self.size - len(self.pairs)
+        for _ in range(count):
+            pair = self.precompute()
+            with self.condition:
+                self.pairs.append(pair)
+                self.generated += 1
+
+    def _refill(self):
+        while True:
+            with self.condition:
+                while self.running and len(self.pairs) >= self.size:
+                    self.condition.wait()
+                if not self.running:
+                    return
+            self.fill(1)
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._refill, name="encryption-pool", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def take(self):
+        """Returns a precomputed pair, computed inline (a miss) when the pool is empty."""
+        with self.condition:
+            if self.pairs:
+                self.hits += 1
+                pair = self.pairs.popleft()
+                self.condition.notify()
+                return pair
+            self.misses += 1
+        return self.precompute()
+
+    def metrics(self) -> dict:
+        with self.condition:
+            return {
+                "size": self.size,
+                "available": len(self.pairs),
+                "hits": self.hits,
+                "misses": self.misses,
+                "generated": self.generated,
+            }
@@ -0,0 +1,144 @@
+### opt-in instrumentation: operation counters and latency histograms
+###
+###   metrics.enable()              counters and latency histograms
+###   metrics.enable(timing=False)  counters only (lowest overhead)
+###   metrics.export_json() / metrics.export_prometheus()
+###
+### while disabled (the default) every probe is a single flag check
+
+import json
+import threading
+import time
+from functools import wraps
+
+ENABLED = False
+TIMING = False
+
+# Upper bounds of the latency buckets, in seconds
+BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 1e-2, 5e-2, 0.1, 0.5, 1.0, 5.0, float("inf"))
+
+_lock = threading.Lock()
+counters = {}
+histograms = {}
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += seconds
+        self.count += 1
+
+
+def enable(timing: bool = True):
+    global ENABLED, TIMING
+    ENABLED = True
+    TIMING = timing
+
+def disable():
+    global ENABLED, TIMING
+    ENABLED = False
+    TIMING = False
+
+def reset():
+    with _lock:
+        counters.clear()
+        histograms.clear()
+
+
+def count(name: str, n: int = 1):
+    if ENABLED:
+        with _lock:
+            counters[name] = counters.get(name, 0) + n
+
+def observe(name: str, seconds: float):
+    with _lock:
+        if name not in histograms:
+            histograms[name] = Histogram()
+        histograms[name].observe(seconds)
+
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        count(self.name)
+        self.start = time.perf_counter() if TIMING else None
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            observe(self.name, time.perf_counter() - self.start)
+        return False
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_TIMER = _NoTimer()
+
+def timed(name: str):
+    """Context manager counting and (if timing is on) timing a block."""
+    return _Timer(name) if ENABLED else _NO_TIMER
+
+def instrumented(name: str):
+    """Decorator counting and (if timing is on) timing every call of a function."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with _Timer(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {
+            "counters": dict(counters),
+            "histograms": {
+                name: {
+                    "buckets": {str(bound): n for bound, n in zip(BUCKETS, h.counts)},
+                    "sum": h.sum,
+                    "count": h.count,
+                }
+                for name, h in histograms.items()
+            },
+        }
+
+def export_json() -> str:
+    return json.dumps(snapshot(), indent=2)
+
+def export_prometheus(prefix: str = "evote") -> str:
+    """Prometheus text exposition format."""
+    data = snapshot()
+    lines = [f"# TYPE {prefix}_operations_total counter"]
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f'{prefix}_operations_total{{op="{name}"}} {value}')
+    lines.append(f"# TYPE {prefix}_latency_seconds histogram")
+    for name, h in sorted(data["histograms"].items()):
+        cumulative = 0
+        for bound, n in h["buckets"].items():
+            cumulative += n
+            le = "+Inf" if bound == "inf" else bound
+            lines.append(f'{prefix}_latency_seconds_bucket{{op="{name}",le="{le}"}} {cumulative}')
+        lines.append(f'{prefix}_latency_seconds_sum{{op="{name}"}} {h["sum"]}')
+        lines.append(f'{prefix}_latency_seconds_count{{op="{name}"}} {h["count"]}')
+    return "\n".join(lines) + "\n"
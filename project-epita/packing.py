@@ -0,0 +1,77 @@
+### packed ballot encoding
+###
+### The candidates of a group (a race) are split into chunks, each encrypted as a
+### single ciphertext of
+###     m = sum(v_i * B^i),  B = max_voters + 1
+### The homomorphic sum of n <= max_voters ballots is sum(count_i * B^i) with every
+### count_i <= n < B, so the counts are the base-B digits of the decrypted total.
+### Its discrete log lies in [0, n * (B^k - 1) / (B - 1)] for a chunk of k candidates
+### and is found in O(sqrt) time and memory, so chunks are as large as MAX_PACKED_BOUND
+### allows; a chunk of one candidate is the plain one-ciphertext-per-candidate encoding.
+
+MAX_PACKED_BOUND = 2**32
+
+
+def packed_bound(n: int, base: int, size: int) -> int:
+    """Largest packed total of n ballots over a chunk of size candidates."""
+    return n * (base**size - 1) // (base - 1)
+
+
+class BallotLayout:
+    """
+    Maps a ballot's vote list to the messages to encrypt, and the decrypted totals
+    back to the candidates' counts.
+    group_sizes: number of candidates of each group, chunks never span two groups
+    max_voters: maximum number of ballots, None for one ciphertext per candidate
+    """
+    def __init__(self, group_sizes: list[int], max_voters: int = None):
+        self.group_sizes = tuple(group_sizes)
+        self.max_voters = max_voters
+        self.base = max_voters + 1 if max_voters else 2
+        chunk_size = 1
+        if max_voters:
+            while packed_bound(max_voters, self.base, chunk_size + 1) <= MAX_PACKED_BOUND:
+                chunk_size += 1
+        self.chunk_size = chunk_size
+
+        # (group, first candidate, number of candidates) of each ciphertext
+        self.chunks = []
+        start = 0
+        for group, size in enumerate(self.group_sizes):
+            for offset in range(0, size, chunk_size):
+                self.chunks.append((group, start + offset, min(chunk_size, size - offset)))
+            start += size
+        self.num_candidates = start
+        self.num_ciphertexts = len(self.chunks)
+
+    @property
+    def packed(self) -> bool:
+        return self.num_ciphertexts < self.num_candidates
+
+    def pack(self, vote_list: list[int]) -> list[int]:
+        """One message per ciphertext."""
+        return [sum(vote_list[start + i] * self.base**i for i in range(size))
+                for _, start, size in self.chunks]
+
+    def bound(self, i: int, n: int) -> int:
+        """Discrete-log search bound of the i-th ciphertext's total over n ballots."""
+        return packed_bound(n, self.base, self.chunks[i][2])
+
+    def bounds(self, n: int) -> list[int]:
+        return [self.bound(i, n) for i in range(self.num_ciphertexts)]
+
+    def unpack(self, totals: list[int]) -> list[int]:
+        """The candidates' counts from the decrypted totals."""
+        counts = []
+        for (_, _, size), total in zip(self.chunks, totals):
+            for _ in range(size - 1):
+                counts.append(total % self.base)
+                total //= self.base
+            counts.append(total)
+        return counts
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, BallotLayout) and (self.group_sizes, self.max_voters) == (other.group_sizes, other.max_voters)
+
+    def __hash__(self) -> int:
+        return hash((self.group_sizes, self.max_voters))
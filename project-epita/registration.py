@@ -0,0 +1,144 @@
+### bulk voter registration from a roster file
+###
+### roster: CSV (a "name" column, or the first column if there is no header)
+###         or JSONL (one "name" string or {"name": ...} object per line)
+###
+### key file: header b"VKEY" | version (1 byte) | method (1 byte, 0 DSA, 1 ECDSA) | count (4 bytes, big-endian)
+###           count * record: name length (2 bytes) | name (utf-8) | x (32 bytes, big-endian)
+###                           | y (DSA: DSA_WIDTH bytes big-endian, ECDSA: 32-byte point as in ballot_codec)
+
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Iterator
+from voters import Voter, SECRET_WIDTH, DSA_WIDTH
+from ballot_codec import encode_point, decode_point, POINT_WIDTH
+
+MAGIC = b"VKEY"
+VERSION = 1
+METHOD_DSA = 0
+METHOD_ECDSA = 1
+HEADER_SIZE = len(MAGIC) + 1 + 1 + 4
+
+
+def read_roster(path: str) -> list[str]:
+    """Voter names of a CSV or JSONL roster, in file order."""
+    names = []
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".json")):
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    names.append(entry["name"] if isinstance(entry, dict) else str(entry))
+        else:
+            rows = csv.reader(f)
+            first = next(rows, None)
+            if first is None:
+                return names
+            column = first.index("name") if "name" in first else 0
+            if "name" not in first:
+                names.append(first[column])
+            names.extend(row[column] for row in rows if row)
+    return [name.strip() for name in names]
+
+
+def generate_sign_keys(sign_method: str, count: int) -> list[tuple]:
+    """Worker: generates count signing key pairs, DSA or ECDSA (sign_method == "el")."""
+    if sign_method == "el":
+        from ecdsa import ECDSA_generate_keys
+        return [ECDSA_generate_keys() for _ in range(count)]
+    from dsa import DSA_generate_keys
+    return [DSA_generate_keys() for _ in range(count)]
+
+
+def _encode_key(sign_method: str, name: str, x: int, y) -> bytes:
+    raw_name = name.encode("utf-8")
+    if sign_method == "el":
+        public = bytearray(POINT_WIDTH)
+        encode_point(public, 0, y)
+    else:
+        public = y.to_bytes(DSA_WIDTH, "big")
+    return b"".join([len(raw_name).to_bytes(2, "big"), raw_name, x.to_bytes(SECRET_WIDTH, "big"), public])
+
+def read_keys(path: str) -> Iterator[tuple]:
+    """Yields (name, sign_key_x, sign_key_y) from a key file written by register_roster."""
+    with open(path, "rb") as f:
+        data = memoryview(f.read())
+    if len(data) < HEADER_SIZE or data[:4] != MAGIC or data[4] != VERSION:
+        raise Exception(f"{path} is not a voter key file")
+    elliptic = data[5] == METHOD_ECDSA
+    count = int.from_bytes(data[6:10], "big")
+    offset = HEADER_SIZE
+    for _ in range(count):
+        name_len = int.from_bytes(data[offset:offset + 2], "big")
+        offset += 2
+        name = str(data[offset:offset + name_len], "utf-8")
+        offset += name_len
+        x = int.from_bytes(data[offset:offset + SECRET_WIDTH], "big")
+        offset += SECRET_WIDTH
+        if elliptic:
+            y = decode_point(data[offset:offset + POINT_WIDTH])
+            offset += POINT_WIDTH
+        else:
+            y = int.from_bytes(data[offset:offset + DSA_WIDTH], "big")
+            offset += DSA_WIDTH
+        yield name, x, y
+
+
+def register_roster(vote_system, roster_path: str, key_path: str = None,
+                    workers: int = None, chunk_size: int = 1024) -> int:
+    """
+    Registers every voter of the roster in vote_system, with signing keys
+    generated in chunks of chunk_size over a process pool of workers processes
+    (in this process if workers == 1). The key pairs are also written to
+    key_path if given. Returns the number of voters registered.
+    """
+    names = read_roster(roster_path)
+    seen = set()
+    for name in names:
+        if name in seen or name in vote_system.voters_map:
+            raise Exception("Voter already exists!")
+        seen.add(name)
+
+    sign_method = vote_system.sign_method
+    chunks = [min(chunk_size, len(names) - i) for i in range(0, len(names), chunk_size)]
+    if workers == 1:
+        results = map(generate_sign_keys, repeat(sign_method), chunks)
+        keys = [pair for chunk in results for pair in chunk]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            keys = [pair for chunk in pool.map(generate_sign_keys, repeat(sign_method), chunks) for pair in chunk]
+
+    if key_path is not None:
+        method = METHOD_ECDSA if sign_method == "el" else METHOD_DSA
+        # The file holds the secret keys: readable by the owner only
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.chmod(key_path, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC + bytes([VERSION, method]) + len(names).to_bytes(4, "big"))
+            for name, (x, y) in zip(names, keys):
+                f.write(_encode_key(sign_method, name, x, y))
+
+    candidates = vote_system.candidates
+    vote_system.add_voters([Voter(name, candidates, x, y) for name, (x, y) in zip(names, keys)])
+    return len(names)
+
+
+if __name__ == "__main__":
+    from candidate import Candidates
+    from vote_system import VoteSystem
+    parser = argparse.ArgumentParser(description="Bulk voter registration")
+    parser.add_argument("roster", help="CSV or JSONL roster")
+    parser.add_argument("--keys", default="voters.keys", help="key file to write")
+    parser.add_argument("--sign", default="default", help='"el" for ECDSA, DSA otherwise')
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    args = parser.parse_args()
+    vote_system = VoteSystem(Candidates(["C1"]), args.sign, "el")
+    start = time.perf_counter()
+    n = register_roster(vote_system, args.roster, args.keys, args.workers, args.chunk_size)
+    print(f"{n} voters registered in {time.perf_counter() - start:.1f}s, keys written to {args.keys}")
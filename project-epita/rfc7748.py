@@ -1,8 +1,14 @@
-from algebra import mod_inv, mod_sqrt
+from algebra import mod_inv, mod_sqrt, batch_inv
+from backend import powmod
+import edwards
+from functools import lru_cache
+import metrics
 
 ### add (and double)
 
 def add(x1:int, y1:int, x2:int, y2:int, p: int):
+    if metrics.ENABLED:
+        metrics.count("point_add")
     a = 486662
     if (x1, y1) == (1, 0):
         return x2, y2
@@ -25,15 +31,211 @@ def add(x1:int, y1:int, x2:int, y2:int, p: int):
 def sub(x1:int, y1:int, x2:int, y2:int, p: int):
     return add(x1, y1, x2, -y2, p)
 
-### unoptimized and not constant-time scalar multiplication
+### sum of many affine points: pairwise tree reduction where each level
+### shares a single inversion between all its additions (Montgomery's trick)
+
+def sum_points(points, p: int):
+    a = 486662
+    level = [(x % p, y % p) if (x, y) != (1, 0) else (1, 0) for x, y in points]
+    if not level:
+        return (1, 0)
+    while len(level) > 1:
+        pairs = []
+        denominators = []
+        for i in range(0, len(level) - 1, 2):
+            (x1, y1), (x2, y2) = level[i], level[i + 1]
+            if (x1, y1) == (1, 0) or (x2, y2) == (1, 0) or (x1 == x2 and (y1 != y2 or y1 == 0)):
+                pairs.append(None)
+            elif x1 == x2:
+                pairs.append(True)
+                denominators.append(2 * y1 % p)
+            else:
+                pairs.append(False)
+                denominators.append((x2 - x1) % p)
+        inverses = iter(batch_inv(denominators, p)) if denominators else iter(())
+        next_level = []
+        for i, doubling in zip(range(0, len(level) - 1, 2), pairs):
+            (x1, y1), (x2, y2) = level[i], level[i + 1]
+            if doubling is None:
+                if (x1, y1) == (1, 0):
+                    next_level.append((x2, y2))
+                elif (x2, y2) == (1, 0):
+                    next_level.append((x1, y1))
+                else:
+                    next_level.append((1, 0))
+                continue
+            if doubling:
+                m = (3 * x1 * x1 + 2 * a * x1 + 1) * next(inverses) % p
+                x3 = (m * m - a - 2 * x1) % p
+            else:
+                m = (y2 - y1) * next(inverses) % p
+                x3 = (m * m - a - x1 - x2) % p
+            next_level.append((x3, (m * (x1 - x3) - y1) % p))
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+    return level[0]
+
+### projective coordinates (X : Y : Z), u = X/Z and v = Y/Z
+### the point at infinity is (0 : 1 : 0), affine (1, 0)
+
+A = 486662
+
+def to_proj(x: int, y: int):
+    if (x, y) == (1, 0):
+        return (0, 1, 0)
+    return (x, y, 1)
+
+def to_affine(P, p: int):
+    X, Y, Z = P
+    if Z % p == 0:
+        return (1, 0)
+    z_inv = mod_inv(Z % p, p)
+    return (X * z_inv % p, Y * z_inv % p)
+
+def double_proj(P, p: int):
+    X, Y, Z = P
+    if Z == 0 or Y % p == 0:
+        return (0, 1, 0)
+    n = (3 * X * X + 2 * A * X * Z + Z * Z) % p
+    s = (2 * Y * Z) % p
+    t = (n * n - (A * Z + 2 * X) * 2 * Y * s) % p
+    ss = s * s % p
+    X3 = t * s % p
+    Y3 = (n * (2 * X * Y * s - t) - 2 * Y * Y * ss) % p
+    Z3 = ss * s % p
+    return (X3, Y3, Z3)
+
+def add_proj(P, Q, p: int):
+    X1, Y1, Z1 = P
+    X2, Y2, Z2 = Q
+    if Z1 == 0:
+        return Q
+    if Z2 == 0:
+        return P
+    u = (Y2 * Z1 - Y1 * Z2) % p
+    w = (X2 * Z1 - X1 * Z2) % p
+    if w == 0:
+        if u == 0:
+            return double_proj(P, p)
+        return (0, 1, 0)
+    Z = Z1 * Z2 % p
+    ww = w * w % p
+    t = (u * u * Z - ww * (A * Z + X1 * Z2 + X2 * Z1)) % p
+    X3 = t * w % p
+    Y3 = (u * (X1 * Z2 * ww - t) - Y1 * Z2 * ww * w) % p
+    Z3 = ww * w * Z % p
+    return (X3, Y3, Z3)
+
+def mult_proj(n: int, P, p: int):
+    T = (0, 1, 0)
+    for t in range(n.bit_length() - 1, -1, -1):
+        T = double_proj(T, p)
+        if (n >> t) & 1:
+            T = add_proj(T, P, p)
+    return T
+
+### simultaneous multiplication n1*P1 + n2*P2 (Straus/Shamir trick) with 2-bit windows:
+### one shared chain of doublings and a table of a*P1 + b*P2 for a, b < 4
+
+def mult2(n1: int, x1: int, y1: int, n2: int, x2: int, y2: int, p: int):
+    # Computed on the Edwards form, whose doubling and addition are cheaper
+    P1 = edwards.from_montgomery(x1, y1)
+    P2 = edwards.from_montgomery(x2, y2)
+    return to_affine(edwards.to_montgomery_proj(edwards.mult2(n1, P1, n2, P2)), p)
+
+### multi-scalar multiplication sum(n_i * P_i) with Pippenger's bucket method:
+### the doublings are shared and each window costs one addition per point
+
+def multi_mult(scalars, points, p: int):
+    # Computed on the Edwards form, whose doubling and addition are cheaper
+    points = [edwards.from_montgomery(x, y) for x, y in points]
+    return to_affine(edwards.to_montgomery_proj(edwards.multi_mult(scalars, points)), p)
+
+### full-point Montgomery ladder: x-only ladder on (X : Z) keeping kP and (k+1)P,
+### then the v-coordinate of kP is recovered from u(P), v(P), kP and (k+1)P
+### (Okeya-Sakurai), so the whole multiplication needs no inversion
+### the ladder always runs over p.bit_length() bits from the identity, so the number
+### of steps does not depend on the scalar's bit length
+
+def ladder_proj(n: int, P, p: int):
+    x, y, z = P
+    if n < 0 or z == 0 or y % p == 0 or x % p == 0:
+        # negative scalars, infinity and the 2-torsion points (v = 0) use the generic path
+        return mult_proj(n, P, p)
+    if z != 1:
+        z_inv = mod_inv(z, p)
+        x, y = x * z_inv % p, y * z_inv % p
+    a24 = (A - 2) // 4
+    X1, Z1, X2, Z2 = 1, 0, x, 1
+    swap = 0
+    for t in range(max(p.bit_length(), n.bit_length()) - 1, -1, -1):
+        k_t = (n >> t) & 1
+        swap ^= k_t
+        X1, X2 = cswap(swap, X1, X2)
+        Z1, Z2 = cswap(swap, Z1, Z2)
+        swap = k_t
+
+        a = X1 + Z1
+        aa = a * a % p
+        b = X1 - Z1
+        bb = b * b % p
+        e = aa - bb
+        da = (X2 - Z2) * a % p
+        cb = (X2 + Z2) * b % p
+        X2 = (da + cb) ** 2 % p
+        Z2 = x * (da - cb) ** 2 % p
+        X1 = aa * bb % p
+        Z1 = e * (aa + a24 * e) % p
+    X1, X2 = cswap(swap, X1, X2)
+    Z1, Z2 = cswap(swap, Z1, Z2)
+
+    if Z1 == 0:
+        # nP is the point at infinity
+        return (0, 1, 0)
+    if Z2 == 0:
+        # (n+1)P is the point at infinity, so nP = -P
+        return (x, -y % p, 1)
+    # v(nP) = ((x u + 1)(x + u + 2A) - 2A - (x - u)^2 u') / 2v with u = u(nP), u' = u((n+1)P)
+    t1 = x * Z1
+    t2 = (X1 + t1 + 2 * A * Z1) * (x * X1 + Z1) - 2 * A * Z1 * Z1
+    Y = (t2 * Z2 - (X1 - t1) ** 2 * X2) % p
+    t1 = 2 * y * Z1 * Z2 % p
+    return (t1 * X1 % p, Y, t1 * Z1 % p)
+
+### scalar multiplication, affine in and out with a single final inversion
 
 def mult(n, x1, y1, p):
-    tx, ty = 1, 0
-    for bit in map(int, bin(n)[2:]):
-        tx, ty = add(tx, ty, tx, ty, p)
-        if bit:
-            tx, ty = add(tx, ty, x1, y1, p)
-    return tx, ty
+    if metrics.ENABLED:
+        metrics.count("scalar_mult")
+    return to_affine(ladder_proj(n, to_proj(x1 % p, y1 % p), p), p)
+
+
+### fixed-base scalar multiplication
+### table[i][d-1] = d * 2^(w*i) * (u, v) in affine form, built once on first use,
+### so a multiplication is one addition per w-bit window and no doubling.
+### The table and the additions are on the Edwards form (see edwards.py),
+### cheaper than the Montgomery projective addition
+
+class FixedBase:
+    def __init__(self, u: int, v: int, p: int, bits: int = 256, w: int = 4):
+        self.u = u
+        self.v = v
+        self.p = p
+        self.bits = bits
+        self.w = w
+        self.edwards = edwards.FixedBase(edwards.from_montgomery(u, v), bits, w)
+
+    def mult_proj(self, n: int):
+        return edwards.to_montgomery_proj(self.edwards.mult(n))
+
+    def mult(self, n: int):
+        return to_affine(self.mult_proj(n), self.p)
+
+@lru_cache(maxsize=None)
+def fixed_base(u: int, v: int, p: int) -> FixedBase:
+    """Shared FixedBase instance for a given point, so its table is only built once."""
+    return FixedBase(u, v, p)
 
 
 ### encoding and decoding functions from RFC 7448
@@ -67,7 +269,8 @@ def cswap(swap, x_2, x_3):
     return x_2, x_3
 
 def mul(k: int, u: int, bits: int, p: int, a24: int):
-    
+    if metrics.ENABLED:
+        metrics.count("scalar_mult_ladder")
     x_1 = u
     x_2 = 1
     z_2 = 0
@@ -99,7 +302,7 @@ def mul(k: int, u: int, bits: int, p: int, a24: int):
 
     x_2, x_3 = cswap(swap, x_2, x_3)
     z_2, z_3 = cswap(swap, z_2, z_3)
-    res = x_2 * pow(z_2, p-2, p) % p
+    res = x_2 * powmod(z_2, p-2, p) % p
     return res
 
 ### computes decoding, scalar multiplication and encoding for the u-coordinate
@@ -119,3 +322,39 @@ def computeVcoordinate(u):
     VV = (pow(u, 3, 2**255 - 19)+486662*pow(u,2,2**255 - 19) + u)%(2**255 - 19)
     V = mod_sqrt(VV, 2**255 - 19)
     return V
+
+
+### recovers the v-coordinate with the given parity from u (p = 5 mod 8, one exponentiation)
+### returns None if u is not the u-coordinate of a curve point
+
+# 2^((p-1)/4), a square root of -1
+SQRT_M1 = 19681161376707505956807079304988542015446066515923890162744021073123829784752
+
+def recoverVcoordinate(u, parity):
+    p = 2**255 - 19
+    VV = (pow(u, 3, p) + 486662 * pow(u, 2, p) + u) % p
+    V = powmod(VV, (p + 3) // 8, p)
+    if V * V % p != VV:
+        V = V * SQRT_M1 % p
+        if V * V % p != VV:
+            return None
+    if V & 1 != parity:
+        V = (p - V) % p
+    return V
+
+
+### Curve25519 base point, BASE_V = computeVcoordinate(BASE_U) hard-coded so that
+### importing the EC modules needs no square root; the constants are checked
+### here, which only costs a few multiplications
+
+BASE_U = 9
+BASE_V = 14781619447589544791020593568409986887264606134616475288964881837755586237401
+
+def _check_constants():
+    p = 2**255 - 19
+    if SQRT_M1 * SQRT_M1 % p != p - 1:
+        raise Exception("Invalid SQRT_M1")
+    if BASE_V * BASE_V % p != (BASE_U**3 + 486662 * BASE_U**2 + BASE_U) % p:
+        raise Exception("Invalid base point")
+
+_check_constants()
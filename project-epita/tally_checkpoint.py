@@ -0,0 +1,70 @@
+### checkpoint of a tally in progress, so an interrupted tally can resume
+###
+### JSON: {"version": 1, "key": election key fingerprint (hex), "ballots": ballot set digest (hex),
+###        "offset": number of ballots already aggregated,
+###        "aggregates": per candidate [c1, c2] or [[u, v], [u, v]] over the first offset ballots,
+###        "totals": per candidate decrypted count, null until its discrete log is found}
+###
+### the file is replaced atomically (temporary file, fsync, os.replace), so a crash
+### while saving leaves the previous checkpoint intact
+
+import hashlib
+import json
+import os
+
+VERSION = 1
+
+
+def ballot_digest(ballots) -> bytes:
+    """SHA-256 over the voter names and messages of the ballots, in order."""
+    h = hashlib.sha256()
+    for ballot in ballots:
+        name = ballot["voter"].encode("utf-8")
+        msg = ballot["ballot"]["msg"]
+        if isinstance(msg, str):
+            msg = msg.encode("utf-8")
+        h.update(len(name).to_bytes(2, "big") + name + len(msg).to_bytes(4, "big"))
+        h.update(msg)
+    return h.digest()
+
+def _tuples(value):
+    return tuple(_tuples(v) for v in value) if isinstance(value, list) else value
+
+
+class TallyCheckpoint:
+    """
+    Partial aggregates and decrypted totals of a tally, bound to one election key
+    and one ballot set: load() refuses a checkpoint written for other ones.
+    """
+    def __init__(self, path: str, key_fingerprint: bytes, digest: bytes):
+        self.path = path
+        self.key_fingerprint = key_fingerprint
+        self.digest = digest
+
+    def load(self):
+        """(offset, aggregates, totals) of the last checkpoint, None if there is none."""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            state = json.load(f)
+        if state.get("version") != VERSION:
+            raise Exception(f"Unsupported tally checkpoint version {state.get('version')}")
+        if bytes.fromhex(state["key"]) != self.key_fingerprint:
+            raise Exception("Tally checkpoint belongs to another election key!")
+        if bytes.fromhex(state["ballots"]) != self.digest:
+            raise Exception("Tally checkpoint belongs to another ballot set!")
+        return state["offset"], list(_tuples(state["aggregates"])), state["totals"]
+
+    def save(self, offset: int, aggregates: list, totals: list):
+        state = {"version": VERSION, "key": self.key_fingerprint.hex(), "ballots": self.digest.hex(),
+                 "offset": offset, "aggregates": aggregates, "totals": totals}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -57,4 +57,666 @@ def test_main_defaults(capsys):
     assert "C2: 2 vote(s)" in captured.out
     assert "C3: 2 vote(s)" in captured.out
     assert "C4: 2 vote(s)" in captured.out
-    assert "C5: 2 vote(s)" in captured.out
\ No newline at end of file
+    assert "C5: 2 vote(s)" in captured.out
+
+def test_baby_giant_log_bounds():
+    import elgamal
+    import ecelgamal
+    from rfc7748 import mult
+    table = elgamal.EG_log_table(10**6)
+    assert table.log(pow(elgamal.PARAM_G, 123456, elgamal.PARAM_P)) == 123456
+    ec_table = ecelgamal.ECEG_log_table(10**6)
+    assert ec_table.log(*mult(10**6, ecelgamal.BaseU, ecelgamal.BaseV, ecelgamal.p)) == 10**6
+    with pytest.raises(ValueError):
+        ec_table.log(*mult(10**6 + 1, ecelgamal.BaseU, ecelgamal.BaseV, ecelgamal.p))
+
+
+def test_projective_mult_matches_affine_add():
+    from rfc7748 import add, mult, computeVcoordinate
+    p = 2**255 - 19
+    u, v = 9, computeVcoordinate(9)
+    acc = (1, 0)
+    for k in range(0, 20):
+        assert mult(k, u, v, p) == acc
+        acc = add(acc[0], acc[1], u, v, p)
+
+
+def test_ladder_matches_double_and_add():
+    import ecelgamal
+    from rfc7748 import ladder_proj, mult_proj, to_proj, to_affine
+    p = ecelgamal.p
+    P = to_proj(ecelgamal.BaseU, ecelgamal.BaseV)
+    Q = to_proj(*ecelgamal.BASE.mult(12345))
+    for k in [0, 1, 2, 7, ecelgamal.ORDER - 1, ecelgamal.ORDER, ecelgamal.ORDER + 1, 2**255 - 1]:
+        for point in (P, Q):
+            assert to_affine(ladder_proj(k, point, p), p) == to_affine(mult_proj(k, point, p), p)
+    # 2-torsion point (0, 0) and the point at infinity
+    assert to_affine(ladder_proj(3, (0, 0, 1), p), p) == (0, 0)
+    assert to_affine(ladder_proj(5, (0, 1, 0), p), p) == (1, 0)
+
+
+def test_ladder_runs_a_fixed_number_of_steps():
+    import ecelgamal
+    import rfc7748
+    P = rfc7748.to_proj(ecelgamal.BaseU, ecelgamal.BaseV)
+    steps = []
+    for k in [1, 2**64 + 1, ecelgamal.ORDER - 1]:
+        with patch("rfc7748.cswap", side_effect=rfc7748.cswap) as cswap:
+            rfc7748.ladder_proj(k, P, ecelgamal.p)
+        steps.append(cswap.call_count)
+    assert steps == [steps[0]] * 3
+
+
+def test_edwards_matches_montgomery():
+    import edwards
+    import ecelgamal
+    from rfc7748 import add, mult, mult2
+    p = ecelgamal.p
+    P, Q = ecelgamal.BASE.mult(77), ecelgamal.BASE.mult(99)
+    Pe, Qe = edwards.from_montgomery(*P), edwards.from_montgomery(*Q)
+    assert edwards.to_montgomery(edwards.add(Pe, Qe)) == add(*P, *Q, p)
+    assert edwards.to_montgomery(edwards.add(Pe, Pe)) == add(*P, *P, p)
+    assert edwards.to_montgomery(edwards.add(Pe, edwards.neg(Pe))) == (1, 0)
+    # infinity and the 2-torsion point (0, 0) go through the same formulas
+    T = edwards.from_montgomery(0, 0)
+    assert edwards.to_montgomery_many([edwards.IDENTITY, T, edwards.add(T, T)]) == [(1, 0), (0, 0), (1, 0)]
+    assert edwards.to_montgomery(edwards.add(Pe, T)) == add(*P, 0, 0, p)
+    for k in [0, 1, 5, ecelgamal.ORDER - 1, 2**255 - 1]:
+        assert edwards.to_montgomery(edwards.mult(k, Pe)) == mult(k, *P, p)
+    assert mult2(5, *P, 7, *Q, p) == add(*mult(5, *P, p), *mult(7, *Q, p), p)
+
+
+def test_fixed_base_matches_mult():
+    import ecelgamal
+    from rfc7748 import mult
+    for k in [0, 1, 15, 16, ecelgamal.ORDER - 1, 0x2c92639dcf417afeae31e0f8fddc8e48b3e11d840523f54aaa97174221faee6]:
+        assert ecelgamal.BASE.mult(k) == mult(k, ecelgamal.BaseU, ecelgamal.BaseV, ecelgamal.p)
+
+
+def test_fixed_base_pow_matches_pow():
+    import dsa
+    from algebra import FixedBasePow
+    table = FixedBasePow(dsa.PARAM_G, dsa.PARAM_P)
+    for e in [0, 1, 31, 32, dsa.PARAM_Q - 1, dsa.PARAM_P - 2, dsa.PARAM_P * 3]:
+        assert table.pow(e) == pow(dsa.PARAM_G, e, dsa.PARAM_P)
+
+
+def test_backend_self_test():
+    import backend
+    from algebra import mod_inv
+    assert "python" in backend.self_test(rounds=5)
+    with pytest.raises(Exception, match="not invertible"):
+        mod_inv(6, 9)
+    for name in backend.available():
+        with pytest.raises(Exception, match="a is not invertible"):
+            backend._BACKENDS[name][2](6, -1, 9)
+
+
+def test_sign_verify_roundtrip():
+    import dsa
+    import ecdsa
+    x, y = dsa.DSA_generate_keys()
+    r, s = dsa.DSA_sign(b"ballot", x)
+    assert dsa.DSA_verify(b"ballot", r, s, y)
+    assert not dsa.DSA_verify(b"ballot!", r, s, y)
+    x, P = ecdsa.ECDSA_generate_keys()
+    r, s = ecdsa.ECDSA_sign(b"ballot", x)
+    assert ecdsa.ECDSA_verify(b"ballot", r, s, P)
+    assert not ecdsa.ECDSA_verify(b"ballot!", r, s, P)
+
+
+
+def test_dsa_batch_rejects_small_order_commitment():
+    import random
+    import dsa
+    x, y = dsa.DSA_generate_keys()
+    items = [(b"ballot", dsa.DSA_sign(b"ballot", x, commit=True), y) for _ in range(4)]
+    p, q = dsa.PARAM_P, dsa.PARAM_Q
+    for _ in range(20):
+        # Signed for the commitment -R = -g^k (order-2 factor): DSA_verify finds R mod q != r,
+        # the combined check only saw (-1)^(z*s) and passed half the time
+        k = random.randrange(1, q)
+        R = p - pow(dsa.PARAM_G, k, p)
+        r = R % q
+        s = pow(k, -1, q) * (dsa.H(b"forged") + x * r) % q
+        forged = (r, s, R)
+        assert not dsa.DSA_verify(b"forged", forged[0], forged[1], y)
+        assert dsa.DSA_verify_batch(items + [(b"forged", forged, y)]) == [4]
+
+
+def test_ecdsa_batch_rejects_torsion_commitment():
+    import random
+    import ecdsa
+    from rfc7748 import add
+    p, n = ecdsa.p, ecdsa.ORDER
+    x, P = ecdsa.ECDSA_generate_keys()
+    items = [(b"ballot", ecdsa.ECDSA_sign(b"ballot", x, commit=True), P) for _ in range(4)]
+    for _ in range(20):
+        # Signed for R = k*G + T, T = (0, 0) of order 2: ECDSA_verify rebuilds k*G and rejects it,
+        # the combined check only saw s*z*T and passed half the time
+        k = random.randrange(1, n)
+        R = add(*ecdsa.BASE.mult(k), 0, 0, p)
+        if R[1] & 1:
+            k, R = n - k, (R[0], p - R[1])
+        r = R[0] % n
+        s = pow(k, -1, n) * (ecdsa.H(b"forged") + x * r) % n
+        assert not ecdsa.ECDSA_verify(b"forged", r, s, P)
+        assert ecdsa.ECDSA_verify_batch(items + [(b"forged", (r, s, R[0]), P)]) == [4]
+
+def test_batch_subgroup_check_is_amortized():
+    import random
+    import batch
+    import dsa
+    import ecdsa
+    from backend import powmod
+    from rfc7748 import add
+    x, y = dsa.DSA_generate_keys()
+    items = [(b"ballot", dsa.DSA_sign(b"ballot", x, commit=True), y) for _ in range(40)]
+    # One exponentiation per round instead of one per signature
+    with patch("dsa.powmod", side_effect=powmod) as dsa_powmod:
+        assert dsa.DSA_verify_batch(items) == []
+    assert dsa_powmod.call_count == batch.SUBGROUP_ROUNDS
+    p, q = dsa.PARAM_P, dsa.PARAM_Q
+    forged = []
+    for _ in range(2):
+        # Two commitments -g^k: their order-2 parts cancel out in any product of both
+        k = random.randrange(1, q)
+        R = p - pow(dsa.PARAM_G, k, p)
+        forged.append((b"forged", (R % q, pow(k, -1, q) * (dsa.H(b"forged") + x * (R % q)) % q, R), y))
+    assert dsa.DSA_verify_batch(items + forged) == [40, 41]
+
+    x, P = ecdsa.ECDSA_generate_keys()
+    items = [(b"ballot", ecdsa.ECDSA_sign(b"ballot", x, commit=True), P) for _ in range(40)]
+    with patch("ecdsa.in_subgroup", side_effect=ecdsa.in_subgroup) as in_subgroup:
+        assert ecdsa.ECDSA_verify_batch(items) == []
+    assert in_subgroup.call_count == batch.SUBGROUP_ROUNDS
+    forged = []
+    for _ in range(2):
+        k = random.randrange(1, ecdsa.ORDER)
+        R = add(*ecdsa.BASE.mult(k), 0, 0, ecdsa.p)
+        if R[1] & 1:
+            k, R = ecdsa.ORDER - k, (R[0], ecdsa.p - R[1])
+        r = R[0] % ecdsa.ORDER
+        forged.append((b"forged", (r, pow(k, -1, ecdsa.ORDER) * (ecdsa.H(b"forged") + x * r) % ecdsa.ORDER, R[0]), P))
+    assert ecdsa.ECDSA_verify_batch(items + forged) == [40, 41]
+
+
+@pytest.mark.parametrize("sign_method", ["default", "el"])
+def test_audit_ballots_finds_tampered_ballots(sign_method):
+    from candidate import Candidates
+    from voters import Voter
+    from vote_system import VoteSystem
+    import dsa
+    import ecdsa
+    candidates = Candidates(["C1", "C2"])
+    system = VoteSystem(candidates, sign_method, "el")
+    for i in range(6):
+        x, y = ecdsa.ECDSA_generate_keys() if sign_method == "el" else dsa.DSA_generate_keys()
+        system.add_voter(Voter(f"v{i}", candidates, x, y))
+        system.cast_vote(f"v{i}", [1, 0] if i % 2 else [0, 1])
+    assert system.audit_ballots() == []
+    system.ballots[4]["ballot"]["msg"] = system.ballots[5]["ballot"]["msg"]
+    assert system.audit_ballots() == [4]
+    with patch("vote_system.STREAM_CHUNK", 3):
+        assert system.audit_ballots() == [4]
+
+
+def test_sum_points_matches_sequential_add():
+    import random
+    from rfc7748 import add, mult, sum_points, computeVcoordinate
+    p = 2**255 - 19
+    G = (9, computeVcoordinate(9))
+    points = [mult(random.randrange(1, 2**252), G[0], G[1], p) for _ in range(20)]
+    points += [(1, 0), G, G, (G[0], p - G[1]), points[0]]
+    expected = (1, 0)
+    for P in points:
+        expected = add(expected[0], expected[1], P[0], P[1], p)
+    assert sum_points(points, p) == expected
+
+
+@pytest.mark.parametrize("elgamal_method", ["default", "el"])
+def test_parallel_tally_matches_serial(elgamal_method):
+    from candidate import Candidates
+    from voters import Voter
+    from vote_system import VoteSystem
+    candidates = Candidates(["C1", "C2", "C3"])
+    system = VoteSystem(candidates, "el", elgamal_method)
+    for i in range(12):
+        system.add_voter(Voter(f"v{i}", candidates, i + 1, None))
+        vote = [0, 0, 0]
+        vote[i % 3 if i < 9 else 0] = 1
+        system.cast_vote(f"v{i}", vote)
+    expected = {"C1": 6, "C2": 3, "C3": 3}
+    assert system.tally_votes() == expected
+    assert system.tally_votes(recount=True) == expected
+    assert system.tally_votes(workers=2) == expected
+    # Streamed in chunks of 5 ballots, and several rounds of worker shards
+    with patch("vote_system.STREAM_CHUNK", 5):
+        assert system.tally_votes(recount=True) == expected
+        assert system.tally_votes(workers=2) == expected
+    assert len(system.snapshot_totals()) == 3
+
+
+def test_ballot_codec_roundtrip():
+    import ballot_codec
+    import ecelgamal
+    import elgamal
+    _, P = ecelgamal.ECEG_generate_keys()
+    ec_ciphertexts = [ecelgamal.ECEG_encrypt(v, P) for v in (0, 1, 0)] + [((1, 0), (1, 0))]
+    data = ballot_codec.encode_ballot(ec_ciphertexts, "el")
+    assert len(data) == ballot_codec.HEADER_SIZE + 4 * 64
+    assert ballot_codec.decode_ballot(data) == ec_ciphertexts
+    _, y = elgamal.EG_generate_keys()
+    eg_ciphertexts = [elgamal.EGA_encrypt(v, y) for v in (1, 0)]
+    data = ballot_codec.encode_ballot(eg_ciphertexts, "default")
+    assert ballot_codec.decode_ballot(bytearray(data)) == eg_ciphertexts
+    legacy = "".join(f"{c1}_{c2}\n" for c1, c2 in eg_ciphertexts)
+    assert ballot_codec.decode_ballot(legacy) == eg_ciphertexts
+    with pytest.raises(ValueError):
+        ballot_codec.decode_ballot(data[:-1])
+    with pytest.raises(ValueError, match="at most 65535"):
+        ballot_codec.encode_ballot([(1, 1)] * (ballot_codec.MAX_CIPHERTEXTS + 1), "default")
+
+
+# Torn length prefix, zero-filled tail (delayed allocation), complete record with a bad CRC
+@pytest.mark.parametrize("tail", [b"\x00\x00\x01\x00partial", bytes(4096),
+                                  b"\x00\x00\x00\x05\x00\x00\x00\x00hello"])
+def test_ballot_store_replay_after_restart(tmp_path, tail):
+    from candidate import Candidates
+    from voters import Voter
+    from vote_system import VoteSystem
+    path = str(tmp_path / "ballots.log")
+    candidates = Candidates(["C1", "C2"])
+    system = VoteSystem(candidates, "el", "el", store_path=path)
+    for i in range(5):
+        system.add_voter(Voter(f"v{i}", candidates, i + 1, None))
+        system.cast_vote(f"v{i}", [1, 0] if i < 3 else [0, 1])
+    system.ballots.sync()
+    keys = (system.eg_x, system.eg_pu)
+    # Simulate a crash in the middle of an append
+    with open(path, "ab") as f:
+        f.write(tail)
+
+    restarted = VoteSystem(candidates, "el", "el", store_path=path, eg_keys=keys)
+    assert len(restarted.ballots) == 5
+    assert restarted.tally_votes() == {"C1": 3, "C2": 2}
+    assert restarted.tally_votes(recount=True) == {"C1": 3, "C2": 2}
+    restarted.add_voter(Voter("v0", candidates, 1, None))
+    with pytest.raises(Exception, match="already voted"):
+        restarted.cast_vote("v0", [0, 1])
+    with pytest.raises(Exception):
+        VoteSystem(candidates, "el", "el", store_path=path)
+
+
+def test_vote_system_close_syncs_ballot_log(tmp_path):
+    from candidate import Candidates
+    from voters import Voter
+    from vote_system import VoteSystem
+    path = str(tmp_path / "ballots.log")
+    candidates = Candidates(["C1", "C2"])
+    # Fewer ballots than fsync_every: they only reach the log when the system is closed
+    with VoteSystem(candidates, "el", "el", store_path=path) as system:
+        for i in range(3):
+            system.add_voter(Voter(f"v{i}", candidates, i + 1, None))
+            system.cast_vote(f"v{i}", [1, 0])
+    assert system.ballots.file.closed
+    with VoteSystem(candidates, "el", "el", store_path=path, eg_keys=(system.eg_x, system.eg_pu)) as restarted:
+        assert restarted.tally_votes() == {"C1": 3, "C2": 0}
+
+
+def test_subgroup_elgamal():
+    import elgamal
+    from candidate import Candidates
+    from voters import Voter
+    from vote_system import VoteSystem
+    candidates = Candidates(["C1", "C2"])
+    system = VoteSystem(candidates, "el", "subgroup", pool_size=2)
+    assert system.eg_x < elgamal.PARAM_Q
+    for i in range(3):
+        system.add_voter(Voter(f"v{i}", candidates, i + 1, None))
+    system.cast_vote("v0", [0, 1])
+    ciphertexts, ballot = system.vote_encryption.encrypt_and_sign([1, 0], 2)
+    system.record_ballot("v1", ciphertexts, ballot)
+    assert system.tally_votes() == {"C1": 1, "C2": 1}
+    # p - 1 is even: -1 has order 2 and is outside the subgroup
+    ciphertexts[0] = (elgamal.PARAM_P - 1, ciphertexts[0][1])
+    with pytest.raises(ValueError):
+        system.record_ballot("v2", ciphertexts, ballot)
+    assert len(system.ballots) == 2
+
+
+@pytest.mark.parametrize("elgamal_method", ["default", "el"])
+def test_encryption_pool(elgamal_method):
+    from candidate import Candidates
+    from voters import Voter
+    from vote_system import VoteSystem
+    candidates = Candidates(["C1", "C2"])
+    system = VoteSystem(candidates, "el", elgamal_method, pool_size=4)
+    system.pool.stop()
+    system.pool.fill()
+    for i in range(3):
+        system.add_voter(Voter(f"v{i}", candidates, i + 1, None))
+        system.cast_vote(f"v{i}", [0, 1] if i else [1, 0])
+    metrics = system.pool.metrics()
+    assert (metrics["hits"], metrics["misses"]) == (4, 2)
+    assert system.tally_votes() == {"C1": 1, "C2": 2}
+    system.pool.start()
+    system.close()
+    assert system.pool.thread is None
+
+
+def test_fixed_base_table_published_when_complete():
+    # The pool thread and cast_vote share the key's table: no thread may see it half built
+    import elgamal
+    from algebra import FixedBasePow
+    table = FixedBasePow(elgamal.PARAM_G, elgamal.PARAM_P)
+    seen = []
+    with patch("algebra.mpz", side_effect=lambda x: seen.append(table.table) or x):
+        assert table.pow(12345) == pow(elgamal.PARAM_G, 12345, elgamal.PARAM_P)
+    assert seen and all(t is None for t in seen)
+
+
+def test_ballot_server_load_test():
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    from candidate import Candidates
+    from vote_system import VoteSystem
+    from ballot_server import BallotServer, load_test
+
+    async def scenario():
+        system = VoteSystem(Candidates(["C1", "C2", "C3"]), "el", "el")
+        server = BallotServer(system, executor=ThreadPoolExecutor(2), queue_size=4, batch_size=3)
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            report = await load_test(30, 3, port=port, concurrency=10)
+        finally:
+            await server.stop()
+        return report, system.tally_votes()
+
+    report, results = asyncio.run(scenario())
+    assert report["voters"] == 30
+    assert results == {"C1": 10, "C2": 10, "C3": 10}
+
+
+def test_ballot_server_reports_rejected_ballot():
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    from candidate import Candidates
+    from vote_system import VoteSystem
+    from ballot_server import BallotServer, _simulated_voter
+
+    async def scenario():
+        # The second ballot is refused by record_ballot, its client must get the error
+        system = VoteSystem(Candidates(["C1", "C2"]), "el", "el", packed=1)
+        server = BallotServer(system, executor=ThreadPoolExecutor(1), batch_size=2)
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            await _simulated_voter("v0", 1, "127.0.0.1", port, None)
+            with pytest.raises(Exception, match="limited to 1 voters"):
+                await asyncio.wait_for(_simulated_voter("v1", 2, "127.0.0.1", port, None), timeout=30)
+        finally:
+            await server.stop()
+        return system.tally_votes()
+
+    assert asyncio.run(scenario()) == {"C1": 1, "C2": 0}
+
+
+def test_ballot_server_records_without_blocking_checks():
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    from candidate import Candidates
+    from vote_system import VoteSystem
+    from ballot_server import BallotServer, load_test
+    executor = ThreadPoolExecutor(2)
+
+    async def scenario():
+        system = VoteSystem(Candidates(["C1", "C2"]), "el", "subgroup")
+        server = BallotServer(system, executor=executor, batch_size=2)
+        listener = await server.start(port=0)
+        try:
+            await load_test(4, 2, port=listener.sockets[0].getsockname()[1])
+        finally:
+            await server.stop()
+        return system.tally_votes()
+
+    # The server's own ballots skip the subgroup check on the event loop
+    with patch("elgamal.EG_check_ciphertext") as check:
+        assert asyncio.run(scenario()) == {"C1": 2, "C2": 2}
+    assert not check.called
+    # A caller's executor is left running
+    assert executor.submit(sum, [1, 2]).result() == 3
+    executor.shutdown()
+
+
+def test_metrics_counters_and_export():
+    import json
+    import metrics
+    from candidate import Candidates
+    from voters import Voter
+    from vote_system import VoteSystem
+    metrics.reset()
+    metrics.enable()
+    try:
+        candidates = Candidates(["C1", "C2"])
+        system = VoteSystem(candidates, "el", "el")
+        for i in range(2):
+            system.add_voter(Voter(f"v{i}", candidates, i + 1, None))
+            system.cast_vote(f"v{i}", [1, 0])
+        assert system.tally_votes() == {"C1": 2, "C2": 0}
+        counters = json.loads(system.metrics_report())["counters"]
+        assert counters["phase.cast_vote"] == 2
+        assert counters["ecdsa.sign"] == 2
+        assert counters["phase.decrypt"] == 2
+        assert counters["scalar_mult_base"] > 0 and counters["mod_inv"] > 0
+        text = system.metrics_report("prometheus")
+        assert 'evote_operations_total{op="phase.encrypt"} 2' in text
+        assert 'evote_latency_seconds_count{op="phase.cast_vote"} 2' in text
+    finally:
+        metrics.disable()
+        metrics.reset()
+    assert metrics.snapshot()["counters"] == {}
+
+
+@pytest.mark.parametrize("sign_method", ["default", "el"])
+def test_register_roster(tmp_path, sign_method):
+    import os
+    from candidate import Candidates
+    from vote_system import VoteSystem
+    from registration import register_roster, read_keys
+    roster = tmp_path / "roster.csv"
+    roster.write_text("id,name\n" + "".join(f"{i},voter{i}\n" for i in range(6)))
+    system = VoteSystem(Candidates(["C1", "C2"]), sign_method, "el")
+    assert register_roster(system, str(roster), str(tmp_path / "voters.keys"), workers=2, chunk_size=4) == 6
+    keys = list(read_keys(str(tmp_path / "voters.keys")))
+    assert os.stat(tmp_path / "voters.keys").st_mode & 0o777 == 0o600
+    assert [name for name, _, _ in keys] == [f"voter{i}" for i in range(6)]
+    for name, x, y in keys:
+        assert (system.voter(name).sign_key_x, system.voters_map[name].sign_key_y) == (x, y)
+    system.cast_vote("voter3", [0, 1])
+    assert system.audit_ballots() == []
+
+    duplicates = tmp_path / "more.jsonl"
+    duplicates.write_text('{"name": "new"}\n"voter0"\n')
+    with pytest.raises(Exception, match="already exists"):
+        register_roster(system, str(duplicates), workers=1)
+    assert "new" not in system.voters_map
+
+
+def test_voter_registry():
+    from candidate import Candidates
+    from voters import Voter, VoterRegistry
+    from ecdsa import ECDSA_generate_keys
+    candidates = Candidates(["C1", "C2"])
+    registry = VoterRegistry(candidates, "el")
+    pairs = [ECDSA_generate_keys() for _ in range(10)]
+    registry.add_many([Voter(f"v{i}", candidates, x, y) for i, (x, y) in enumerate(pairs)])
+    with pytest.raises(Exception, match="already exists"):
+        registry.add_many([Voter("w", candidates, 1, None), Voter("v3", candidates, 1, None)])
+    assert list(registry) == [f"v{i}" for i in range(10)] and "w" not in registry
+    voter = registry["v9"]
+    # Public data only, the secret keys are kept by the voting system
+    assert (voter.sign_key_x, voter.sign_key_y) == (None, pairs[9][1])
+    assert registry.public_key("v3") == pairs[3][1]
+    registry.add(Voter("Zoé", candidates, None, None))
+    assert "Zoé" in registry and list(registry)[-1] == "Zoé" and registry.public_key("Zoé") is None
+    registry.mark_voted("v9")
+    assert registry.has_voted("v9") and not registry.has_voted("v8")
+    with pytest.raises(Exception, match="already voted"):
+        registry.mark_voted("v9")
+    with pytest.raises(Exception, match="not registered"):
+        registry.has_voted("nobody")
+
+
+def test_precomputed_constants_and_lazy_imports():
+    import os
+    import subprocess
+    import sys
+    from rfc7748 import computeVcoordinate, BASE_U, BASE_V, SQRT_M1
+    import edwards
+    import voters
+    import dsa
+    p = 2**255 - 19
+    assert BASE_V == computeVcoordinate(BASE_U)
+    assert SQRT_M1 == pow(2, (p - 1) // 4, p)
+    assert edwards.D == -121665 * pow(121666, -1, p) % p
+    assert edwards.C * edwards.C % p == -(edwards.A + 2) % p
+    assert voters.DSA_WIDTH == (dsa.PARAM_P.bit_length() + 7) // 8
+    # Importing the voting system loads neither Crypto nor the process pool
+    loaded = subprocess.run([sys.executable, "-c", "import sys, vote_system; print(sorted(sys.modules))"],
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, check=True).stdout
+    assert "Crypto" not in loaded and "concurrent.futures.process" not in loaded and "'dsa'" not in loaded
+
+
+
+@pytest.mark.parametrize("elgamal_method", ["default", "el"])
+def test_checkpointed_tally_resumes(tmp_path, elgamal_method):
+    import os
+    import vote_system
+    from candidate import Candidates
+    from voters import Voter
+    from vote_system import VoteSystem
+    from ecdsa import ECDSA_generate_keys
+    system = VoteSystem(Candidates(["C1", "C2", "C3"]), "el", elgamal_method)
+    for i in range(7):
+        x, y = ECDSA_generate_keys()
+        system.add_voter(Voter(f"v{i}", system.candidates, x, y))
+        system.cast_vote(f"v{i}", [1 if j == i % 3 else 0 for j in range(3)])
+    path = str(tmp_path / "tally.ckpt")
+
+    # Interrupted during the discrete-log search of the second candidate
+    decrypt_total = vote_system.decrypt_total
+    calls = []
+    def interrupt_second(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return decrypt_total(*args)
+    with patch("vote_system.decrypt_total", side_effect=interrupt_second):
+        with pytest.raises(KeyboardInterrupt):
+            system.tally_votes(checkpoint_path=path, checkpoint_every=3)
+
+    # Resumed without aggregating the ballots or decrypting the first total again
+    with patch("vote_system.aggregate_messages") as aggregate, \
+         patch("vote_system.decrypt_total", wraps=decrypt_total) as decrypt:
+        assert system.tally_votes(checkpoint_path=path) == {"C1": 3, "C2": 2, "C3": 2}
+    aggregate.assert_not_called()
+    assert decrypt.call_count == 2
+    assert not os.path.exists(path)
+
+    # A checkpoint left for another ballot set is refused
+    with patch("vote_system.decrypt_total", side_effect=KeyboardInterrupt):
+        with pytest.raises(KeyboardInterrupt):
+            system.tally_votes(checkpoint_path=path)
+    system.ballots.pop()
+    with pytest.raises(Exception, match="another ballot set"):
+        system.tally_votes(checkpoint_path=path)
+
+
+@pytest.mark.parametrize("elgamal_method", ["default", "el"])
+def test_multi_race_election(tmp_path, elgamal_method):
+    from candidate import Candidates
+    from voters import Voter
+    from election import Election
+    from ecdsa import ECDSA_generate_keys
+    election = Election({"referendum": Candidates(["yes", "no"]), "mayor": Candidates(["A", "B", "C"])},
+                        "el", elgamal_method, cache_size=1)
+    votes = [{"referendum": [1, 0], "mayor": [0, 0, 1]}, {"referendum": [0, 1]},
+             {"mayor": [1, 0, 0]}, {"referendum": [1, 0], "mayor": [0, 0, 1]}]
+    for i, ballot in enumerate(votes):
+        x, y = ECDSA_generate_keys()
+        election.add_voter(Voter(f"v{i}", election.candidates, x, y))
+        election.cast_vote(f"v{i}", ballot)
+    with pytest.raises(Exception):
+        election.cast_vote("v0", {"mayor": [0, 1, 0]})
+    x, y = ECDSA_generate_keys()
+    election.add_voter(Voter("v4", election.candidates, x, y))
+    with pytest.raises(Exception, match="Unknown race"):
+        election.cast_vote("v4", {"governor": [1]})
+    with pytest.raises(Exception):
+        election.cast_vote("v4", {"mayor": [1, 1, 0]})
+
+    # One signed message per voter holding every race
+    assert len(election.ballots) == 4 and election.audit_ballots() == []
+    expected = {"referendum": {"yes": 2, "no": 1}, "mayor": {"A": 1, "B": 0, "C": 2}}
+    assert election.tally_votes() == expected
+    # One table for the five candidates of both races
+    assert election.log_tables.misses == 1 and election.log_tables.hits == 4
+    assert election.tally_votes(max_voters={"referendum": 100}, recount=True) == expected
+    assert len(election.log_tables) == 1
+    # The parallel and checkpointed recounts of VoteSystem work for every race at once
+    assert election.tally_votes(max_voters={"mayor": 10}, workers=2) == expected
+    assert election.tally_votes(checkpoint_path=str(tmp_path / "tally.json"), checkpoint_every=3) == expected
+
+
+@pytest.mark.parametrize("elgamal_method", ["default", "subgroup", "el"])
+def test_packed_ballots(elgamal_method):
+    import packing
+    from candidate import Candidates
+    from voters import Voter
+    from vote_system import VoteSystem
+    from election import Election
+    from ecdsa import ECDSA_generate_keys
+    # 5 candidates and 9 voters fit in one ciphertext, a 2**20 electorate only in one per candidate
+    assert packing.BallotLayout([5], 9).num_ciphertexts == 1
+    assert not packing.BallotLayout([5], 2**20).packed
+    layout = packing.BallotLayout([4, 3], 2**14)
+    assert [size for _, _, size in layout.chunks] == [2, 2, 2, 1]
+    assert layout.unpack(layout.pack([0, 0, 1, 0, 1, 0, 0])) == [0, 0, 1, 0, 1, 0, 0]
+
+    system = VoteSystem(Candidates(["C1", "C2", "C3", "C4", "C5"]), "el", elgamal_method, packed=9)
+    for i in range(9):
+        x, y = ECDSA_generate_keys()
+        system.add_voter(Voter(f"v{i}", system.candidates, x, y))
+        system.cast_vote(f"v{i}", [1 if j == i % 4 else 0 for j in range(5)])
+    assert len(system.snapshot_totals()) == 1
+    expected = {"C1": 3, "C2": 2, "C3": 2, "C4": 2, "C5": 0}
+    assert system.tally_votes() == expected
+    assert system.tally_votes(recount=True, max_voters=9) == expected
+    x, y = ECDSA_generate_keys()
+    system.add_voter(Voter("v9", system.candidates, x, y))
+    with pytest.raises(Exception, match="limited to 9 voters"):
+        system.cast_vote("v9", [1, 0, 0, 0, 0])
+
+    election = Election({"referendum": Candidates(["yes", "no"]), "mayor": Candidates(["A", "B", "C"])},
+                        "el", elgamal_method, packed=100)
+    for i in range(3):
+        x, y = ECDSA_generate_keys()
+        election.add_voter(Voter(f"v{i}", election.candidates, x, y))
+        election.cast_vote(f"v{i}", {"referendum": [i % 2, 1 - i % 2], "mayor": [0, 1, 0]} if i else {"mayor": [0, 0, 1]})
+    assert len(election.snapshot_totals()) == 2
+    assert election.tally_votes() == {"referendum": {"yes": 1, "no": 1}, "mayor": {"A": 0, "B": 2, "C": 1}}
+
+
+def test_benchmark_only_filters_before_running(capsys):
+    import benchmark
+    with patch("benchmark.import_time", return_value=0.001) as import_time, \
+         patch("benchmark.election") as election, \
+         patch("benchmark.dsa.DSA_generate_keys") as dsa_keygen, \
+         patch("benchmark.elgamal.EG_log_table") as eg_table:
+        assert benchmark.main(["--only", "ecdsa.verify", "--quick"]) == 0
+    assert capsys.readouterr().out.startswith("ecdsa.verify")
+    assert not import_time.called and not election.called
+    assert not dsa_keygen.called and not eg_table.called
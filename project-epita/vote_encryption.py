@@ -1,43 +1,102 @@
 from enum import Enum
 from typing import Tuple, Union
-import dsa
 import elgamal
-import ecdsa
 import ecelgamal
+from algebra import FixedBasePow
+import ballot_codec
+from encryption_pool import EncryptionPool
+from packing import BallotLayout
+import metrics
 
 class Method(Enum):
     Default = 0
     Elliptique = 1
+    Subgroup = 2
 
 class VoteEncryption:
-    def __init__(self, sign_method: str, elgamal_method: str, eg_pu_key: Union[int, Tuple[int, int]]):
+    def __init__(self, sign_method: str, elgamal_method: str, eg_pu_key: Union[int, Tuple[int, int]],
+                 pool: EncryptionPool = None, layout: BallotLayout = None):
+        """
+        pool (optional): EncryptionPool of precomputed randomness for eg_pu_key
+        layout (optional): packed encoding of the vote list, one ciphertext per candidate by default
+        """
         self.sign_method = Method.Default
         self.elgamal_method = Method.Default
         self.eg_pu_key = eg_pu_key
+        self.pool = pool
+        self.layout = layout
 
         if sign_method == "el":
             self.sign_method = Method.Elliptique
         if elgamal_method == "el":
             self.elgamal_method = Method.Elliptique
+        elif elgamal_method == "subgroup":
+            self.elgamal_method = Method.Subgroup
 
-    def encrypt_votes(self, vote_list: list[int]) -> str:
-        msg = ""
+        # Only the selected signature scheme is loaded, DSA and ECDSA both pull in Crypto
+        if self.sign_method == Method.Elliptique:
+            import ecdsa
+            self.sign, self.verify_batch = ecdsa.ECDSA_sign, ecdsa.ECDSA_verify_batch
+        else:
+            import dsa
+            self.sign, self.verify_batch = dsa.DSA_sign, dsa.DSA_verify_batch
+
+        # Short exponents below q in the subgroup mode
+        self.eg_q = elgamal.PARAM_Q if self.elgamal_method == Method.Subgroup else None
+
+        # Fixed-base table for the election key, reused by every ballot
+        self.eg_pu_pow = None
+        if self.elgamal_method != Method.Elliptique:
+            self.eg_pu_pow = FixedBasePow(eg_pu_key, elgamal.PARAM_P,
+                                          self.eg_q.bit_length() if self.eg_q else None)
+
+    @metrics.instrumented("phase.encrypt")
+    def encrypt_ciphertexts(self, vote_list: list[int]) -> list:
+        if self.layout is not None:
+            vote_list = self.layout.pack(vote_list)
+        ciphertexts = []
         for vote in vote_list:
             if self.elgamal_method == Method.Elliptique:
-                R, C = ecelgamal.ECEG_encrypt(vote, self.eg_pu_key)
-                msg += f"{R[0]}_{R[1]}_{C[0]}_{C[1]}\n"
+                if self.pool is not None:
+                    ciphertexts.append(ecelgamal.ECEG_encrypt_precomputed(vote, self.pool.take()))
+                else:
+                    ciphertexts.append(ecelgamal.ECEG_encrypt(vote, self.eg_pu_key))
             else:
-                c1, c2 = elgamal.EGA_encrypt(vote, self.eg_pu_key)
-                msg += f"{c1}_{c2}\n"
-        return msg
+                if self.pool is not None:
+                    ciphertexts.append(elgamal.EGA_encrypt_precomputed(vote, self.pool.take()))
+                else:
+                    ciphertexts.append(elgamal.EGA_encrypt(vote, self.eg_pu_key, y_pow=self.eg_pu_pow, q=self.eg_q))
+        return ciphertexts
 
-    def sign_message(self, msg: str, sign_key_x: int) -> Tuple[int, int]:
-        if self.sign_method == Method.Elliptique:
-            return ecdsa.ECDSA_sign(msg.encode(), sign_key_x)
-        else:
-            return dsa.DSA_sign(msg.encode(), sign_key_x)
+    def encrypt_votes(self, vote_list: list[int]) -> bytes:
+        method = "el" if self.elgamal_method == Method.Elliptique else "default"
+        return ballot_codec.encode_ballot(self.encrypt_ciphertexts(vote_list), method)
 
-    def create_encrypted_msg(self, vote_list: list[int], sign_key_x: int) -> dict:
-        encrypted_vote = self.encrypt_votes(vote_list)
+    @metrics.instrumented("phase.sign")
+    def sign_message(self, msg: Union[bytes, str], sign_key_x: int) -> Tuple[int, int]:
+        if isinstance(msg, str):
+            msg = msg.encode()
+        # The commitment is kept with the signature so ballots can be batch-verified
+        return self.sign(msg, sign_key_x, commit=True)
+
+    @metrics.instrumented("phase.verify")
+    def verify_messages(self, items: list) -> list[int]:
+        """
+        items: list of (msg, signature, sign_key_y)
+        Returns the indices of the messages whose signature is invalid.
+        """
+        items = [(msg.encode() if isinstance(msg, str) else msg, signature, key)
+                 for msg, signature, key in items]
+        return self.verify_batch(items)
+
+    def encrypt_and_sign(self, vote_list: list[int], sign_key_x: int) -> Tuple[list, dict]:
+        """Returns the ciphertexts along with the signed ballot built from them."""
+        ciphertexts = self.encrypt_ciphertexts(vote_list)
+        method = "el" if self.elgamal_method == Method.Elliptique else "default"
+        with metrics.timed("phase.serialize"):
+            encrypted_vote = ballot_codec.encode_ballot(ciphertexts, method)
         signature = self.sign_message(encrypted_vote, sign_key_x)
-        return {"msg": encrypted_vote, "signature": signature}
\ No newline at end of file
+        return ciphertexts, {"msg": encrypted_vote, "signature": signature}
+
+    def create_encrypted_msg(self, vote_list: list[int], sign_key_x: int) -> dict:
+        return self.encrypt_and_sign(vote_list, sign_key_x)[1]
\ No newline at end of file
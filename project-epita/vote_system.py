@@ -1,90 +1,386 @@
 # vote_system.py
+from functools import lru_cache
+from collections import deque
+from itertools import islice, repeat
 from candidate import Candidates
-from voters import Voter
+from voters import Voter, VoterRegistry, SecretKeys
 from vote_encryption import VoteEncryption
-import dsa
+import ballot_codec
+from ballot_store import BallotStore
+from tally_checkpoint import TallyCheckpoint, ballot_digest
+from packing import BallotLayout
+from encryption_pool import EncryptionPool
+import metrics
+# Both encryption schemes are imported eagerly, unlike the signature schemes (see
+# vote_encryption): their own code is under 1 ms of import time, the rest (algebra,
+# dlog, rfc7748) being needed by either scheme and by the ballot codec anyway
 import elgamal
-import ecdsa
 import ecelgamal
-from rfc7748 import add as ec_add  # Import ec_add for elliptic curve addition
-from ecelgamal import p as ec_p, ECEG_decrypt  # Import EC ElGamal parameters
+from rfc7748 import sum_points  # Batched point summation (one inversion per tree level)
+from rfc7748 import to_proj, to_affine, add_proj
+from ecelgamal import p as ec_p  # Import EC ElGamal parameters
 from ecelgamal import ECEG_decrypt_tally
 
+# Ballots held in memory at a time when streaming them from the store
+STREAM_CHUNK = 4096
+
 
 class VoteSystem:
-    def __init__(self, candidates: Candidates, sign_method: str, elgamal_method: str):
+    def __init__(self, candidates: Candidates, sign_method: str, elgamal_method: str,
+                 store_path: str = None, eg_keys: tuple = None, pool_size: int = 0, packed: int = None):
+        """
+        store_path: keep the ballots in a durable append-only log instead of memory;
+                    an existing log is replayed, which requires the same election keys.
+        eg_keys: (private key, public key) of the election, generated if not given.
+        pool_size: if > 0, encryption randomness is precomputed in the background
+                   by an EncryptionPool of this size (see self.pool.metrics()).
+        packed: maximum number of ballots; if given, the votes for several candidates
+                are packed into each ciphertext (see packing.py) when the range allows it.
+        """
         self.candidates = candidates
         self.sign_method = sign_method
         self.elgamal_method = elgamal_method
-        self.voters_map = {}
-        self.ballots = []
+        # Registered voters, by name (see VoterRegistry)
+        self.voters_map = VoterRegistry(candidates, sign_method)
+        # Their private signing keys, by voter id, kept out of the registry
+        self.secret_keys = SecretKeys()
 
         # Generate keys based on the selected encryption method
-        if elgamal_method == "el":
-            from ecelgamal import ECEG_generate_keys
-            self.eg_x, self.eg_pu = ECEG_generate_keys()
-            self.eg_pu_key = self.eg_pu
-        else:
-            from elgamal import EG_generate_keys
-            self.eg_x, self.eg_y = EG_generate_keys()
-            self.eg_pu_key = self.eg_y
+        with metrics.timed("phase.keygen"):
+            if elgamal_method == "el":
+                from ecelgamal import ECEG_generate_keys
+                self.eg_x, self.eg_pu = eg_keys if eg_keys else ECEG_generate_keys()
+                self.eg_pu_key = self.eg_pu
+            else:
+                from elgamal import EG_generate_keys
+                # "subgroup": short keys and exponents in the order-q subgroup
+                q = elgamal.PARAM_Q if elgamal_method == "subgroup" else None
+                self.eg_x, self.eg_y = eg_keys if eg_keys else EG_generate_keys(q=q)
+                self.eg_pu_key = self.eg_y
 
         # Initialize VoteEncryption
-        self.vote_encryption = VoteEncryption(sign_method, elgamal_method, self.eg_pu_key)
+        self.layout = self.ballot_layout(packed)
+        self.pool = EncryptionPool(elgamal_method, self.eg_pu_key, pool_size) if pool_size > 0 else None
+        self.vote_encryption = VoteEncryption(sign_method, elgamal_method, self.eg_pu_key, self.pool, self.layout)
+        # Encrypted totals per ciphertext of the layout, updated by every accepted ballot
+        self.running_tally = RunningTally(elgamal_method, self.layout.num_ciphertexts)
+
+        if store_path is None:
+            self.ballots = []
+        else:
+            self.ballots = BallotStore(store_path, self.key_fingerprint())
+            for ballot in self.ballots:
+                self.voters_map.mark_replayed(ballot["voter"])
+                ciphertexts = ballot_codec.decode_ballot(ballot["ballot"]["msg"])
+                self.check_ciphertexts(ciphertexts)
+                self.running_tally.add(ciphertexts)
+
+    def sync(self):
+        """Makes every recorded ballot durable in the ballot log, if there is one."""
+        if isinstance(self.ballots, BallotStore):
+            self.ballots.sync()
+
+    def close(self):
+        """
+        Syncs and closes the ballot log: ballots recorded since the last fsync would be lost otherwise.
+        Also stops the encryption pool's background thread.
+        """
+        if isinstance(self.ballots, BallotStore):
+            self.ballots.close()
+        if self.pool is not None:
+            self.pool.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def ballot_layout(self, packed: int = None) -> BallotLayout:
+        """All the candidates form a single group."""
+        return BallotLayout([self.candidates.candidate_number], packed)
+
+    def key_fingerprint(self) -> bytes:
+        """SHA-256 of the election public key."""
+        import hashlib
+        return hashlib.sha256(repr(self.eg_pu_key).encode()).digest()
 
     def add_voter(self, voter: Voter):
-        if voter.name in self.voters_map:
-            raise Exception("Voter already exists!")
-        self.voters_map[voter.name] = voter
+        self.voters_map.add(voter)
+        self.secret_keys.append(voter.sign_key_x)
 
-    def cast_vote(self, voter_name: str, vote_list: list[int]):
-        if voter_name not in self.voters_map:
-            raise Exception("Voter not registered!")
+    def add_voters(self, voters: list[Voter]):
+        """Registers many voters in one pass; none is added if a name is already taken."""
+        self.voters_map.add_many(voters)
+        for voter in voters:
+            self.secret_keys.append(voter.sign_key_x)
+
+    def voter(self, voter_name: str) -> Voter:
+        """The registered voter, with its private signing key."""
         voter = self.voters_map[voter_name]
+        voter.sign_key_x = self.secret_keys[self.voters_map.id_of(voter_name)]
+        return voter
+
+    @metrics.instrumented("phase.cast_vote")
+    def cast_vote(self, voter_name: str, vote_list: list[int]):
+        if self.voters_map.has_voted(voter_name):
+            raise Exception("Voter has already voted!")
+        voter = self.voter(voter_name)
         voter.create_vote(vote_list)
-        ballot = self.vote_encryption.create_encrypted_msg(vote_list, voter.sign_key_x)
-        self.ballots.append({"voter": voter_name, "ballot": ballot})
+        ciphertexts, ballot = self.vote_encryption.encrypt_and_sign(vote_list, voter.sign_key_x)
+        # Encrypted here, so the subgroup membership check is not needed
+        self._append_ballot(voter_name, ciphertexts, ballot)
         print(f"Ballot from {voter_name} recorded.")
 
-    def tally_votes(self) -> dict:
-        num_candidates = self.candidates.candidate_number
-        # Initialize aggregated ciphertexts based on encryption method
-        if self.elgamal_method == "el":
-            aggregated = [((1, 0), (1, 0)) for _ in range(num_candidates)]
+    def record_ballot(self, voter_name: str, ciphertexts: list, ballot: dict, check: bool = True):
+        """
+        Stores a ballot encrypted and signed elsewhere (e.g. by a worker process) and adds it to the running tally.
+        check=False skips the subgroup membership check, for ballots encrypted by this election's own workers.
+        """
+        if check:
+            self.check_ciphertexts(ciphertexts)
+        self._append_ballot(voter_name, ciphertexts, ballot)
+
+    def _append_ballot(self, voter_name: str, ciphertexts: list, ballot: dict):
+        if self.layout.max_voters is not None and len(self.ballots) >= self.layout.max_voters:
+            # One more ballot could overflow a base-B digit of the packed totals
+            raise Exception(f"Packed ballots are limited to {self.layout.max_voters} voters!")
+        self.voters_map.mark_voted(voter_name)
+        self.ballots.append({"voter": voter_name, "ballot": ballot})
+        self.running_tally.add(ciphertexts)
+
+    def check_ciphertexts(self, ciphertexts: list):
+        """In the subgroup mode, rejects (ValueError) ciphertexts outside the order-q subgroup."""
+        if self.elgamal_method == "subgroup":
+            for c1, c2 in ciphertexts:
+                elgamal.EG_check_ciphertext(c1, c2)
+
+    def snapshot_totals(self) -> list:
+        """Current encrypted totals, one (c1, c2) or (R, C) per ciphertext, without rescanning the ballots."""
+        return self.running_tally.snapshot()
+
+    def metrics_report(self, fmt: str = "json") -> str:
+        """
+        Counters and latency histograms collected since metrics.enable(),
+        as JSON or in the Prometheus text format (fmt="prometheus").
+        """
+        if fmt == "prometheus":
+            return metrics.export_prometheus()
+        return metrics.export_json()
+
+    def audit_ballots(self) -> list[int]:
+        """
+        Batch-verifies every ballot signature, returns the indices of the invalid ballots.
+        The ballots are read and verified STREAM_CHUNK at a time.
+        """
+        invalid = []
+        ballots = iter(self.ballots)
+        offset = 0
+        while True:
+            items = [(ballot["ballot"]["msg"], ballot["ballot"]["signature"],
+                      self.voters_map.public_key(ballot["voter"])) for ballot in islice(ballots, STREAM_CHUNK)]
+            if not items:
+                return invalid
+            invalid += [offset + i for i in self.vote_encryption.verify_messages(items)]
+            offset += len(items)
+
+    @metrics.instrumented("phase.tally")
+    def tally_votes(self, max_voters: int = None, workers: int = None, recount: bool = False,
+                    checkpoint_path: str = None, checkpoint_every: int = 10000) -> dict:
+        """
+        max_voters bounds the discrete-log search for each total,
+        defaults to the number of recorded ballots.
+        By default the running totals kept by cast_vote are decrypted;
+        recount=True aggregates the stored ballots again instead.
+        workers > 1 recounts with the ballots split into shards aggregated in
+        a process pool, then decrypts the totals in parallel.
+        checkpoint_path: recount in this process, saving the partial aggregates every
+                         checkpoint_every ballots and each decrypted total to this file;
+                         an interrupted tally called again with the same file resumes
+                         from the last checkpoint, which is removed once the tally is done.
+        """
+        num_ciphertexts = self.layout.num_ciphertexts
+        bounds = self._bounds(max_voters)
+
+        if checkpoint_path is not None:
+            totals = self._checkpointed_totals(bounds, checkpoint_path, checkpoint_every)
+        elif workers is None or workers <= 1:
+            if recount:
+                messages = (ballot["ballot"]["msg"] for ballot in self.ballots)
+                aggregated = aggregate_messages(self.elgamal_method, messages, num_ciphertexts)
+            else:
+                aggregated = self.running_tally.snapshot()
+            totals = [self._decrypt(aggregated[i], bounds[i]) for i in range(num_ciphertexts)]
         else:
-            aggregated = [(1, 1) for _ in range(num_candidates)]
-        
-
-        # Aggregate votes
-        for ballot in self.ballots:
-            encrypted_lines = ballot["ballot"]["msg"].strip().split("\n")
-            for i, line in enumerate(encrypted_lines):
-                if self.elgamal_method == "el":
-                    parts = list(map(int, line.split("_")))
-                    R, C = ((parts[0], parts[1]), (parts[2], parts[3]))
-                    agg_R, agg_C = aggregated[i]
-                    aggregated[i] = (
-                        ec_add(agg_R[0], agg_R[1], R[0], R[1], ec_p),
-                        ec_add(agg_C[0], agg_C[1], C[0], C[1], ec_p)
-                    )
-                else:
-                    # Classic ElGamal: split into c1 and c2
-                    c1, c2 = map(int, line.split("_"))
-                    aggregated[i] = (
-                        (aggregated[i][0] * c1) % elgamal.PARAM_P,
-                        (aggregated[i][1] * c2) % elgamal.PARAM_P
-                    )
-
-        # Decrypt totals
-        results = {}
-        for i in range(num_candidates):
+            # Loaded on demand, concurrent.futures.process alone doubles the import time
+            from concurrent.futures import ProcessPoolExecutor
+            messages = (ballot["ballot"]["msg"] for ballot in self.ballots)
+            shard_size = min(max(1, -(-len(self.ballots) // (workers * 4))), STREAM_CHUNK)
+            aggregated = combine_aggregates(self.elgamal_method, [], num_ciphertexts)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # Shards are read as workers free up, at most 2 * workers of them in memory
+                pending = deque()
+                while True:
+                    shard = list(islice(messages, shard_size))
+                    if shard:
+                        pending.append(pool.submit(aggregate_messages, self.elgamal_method, shard, num_ciphertexts))
+                    if pending and (not shard or len(pending) >= 2 * workers):
+                        partial = pending.popleft().result()
+                        aggregated = combine_aggregates(self.elgamal_method, [aggregated, partial], num_ciphertexts)
+                    if not shard and not pending:
+                        break
+                totals = list(pool.map(decrypt_total, repeat(self.elgamal_method), aggregated,
+                                       repeat(self.eg_x), bounds))
+
+        return self._results(self.layout.unpack(totals))
+
+    def _bounds(self, max_voters: int = None) -> list[int]:
+        """Search bound of each ciphertext's total, max_voters unless the ballots are packed."""
+        return self.layout.bounds(len(self.ballots) if max_voters is None else max_voters)
+
+    def _decrypt(self, aggregate: tuple, bound: int) -> int:
+        return decrypt_total(self.elgamal_method, aggregate, self.eg_x, bound)
+
+    def _results(self, counts: list[int]) -> dict:
+        return {candidate: counts[i] for i, candidate in enumerate(self.candidates.candidate_list)}
+
+    def _checkpointed_totals(self, bounds: list[int], checkpoint_path: str, checkpoint_every: int) -> list[int]:
+        num_ciphertexts = self.layout.num_ciphertexts
+        # The checkpoint is only valid for the same election key and the same ballots
+        checkpoint = TallyCheckpoint(checkpoint_path, self.key_fingerprint(), ballot_digest(self.ballots))
+        state = checkpoint.load()
+        if state is None:
+            offset, totals = 0, [None] * num_ciphertexts
+            aggregated = combine_aggregates(self.elgamal_method, [], num_ciphertexts)
+        else:
+            offset, aggregated, totals = state
+
+        ballots = islice(iter(self.ballots), offset, None)
+        while True:
+            messages = [ballot["ballot"]["msg"] for ballot in islice(ballots, checkpoint_every)]
+            if not messages:
+                break
+            partial = aggregate_messages(self.elgamal_method, messages, num_ciphertexts)
+            aggregated = combine_aggregates(self.elgamal_method, [aggregated, partial], num_ciphertexts)
+            offset += len(messages)
+            checkpoint.save(offset, aggregated, totals)
+
+        for i in range(num_ciphertexts):
+            if totals[i] is None:
+                totals[i] = self._decrypt(aggregated[i], bounds[i])
+                checkpoint.save(offset, aggregated, totals)
+        checkpoint.remove()
+        return totals
+
+
+class RunningTally:
+    """
+    Homomorphic running totals, one per candidate, updated in O(candidates) per ballot.
+    EC totals are kept in projective coordinates so no inversion is needed until snapshot().
+    """
+    def __init__(self, elgamal_method: str, num_candidates: int):
+        self.elgamal_method = elgamal_method
+        self.count = 0
+        if elgamal_method == "el":
+            self.totals = [((0, 1, 0), (0, 1, 0)) for _ in range(num_candidates)]
+        else:
+            self.totals = [(1, 1) for _ in range(num_candidates)]
+
+    @metrics.instrumented("phase.aggregate")
+    def add(self, ciphertexts: list):
+        for i, (first, second) in enumerate(ciphertexts):
             if self.elgamal_method == "el":
-                R_total, C_total = aggregated[i]
-                total = ECEG_decrypt_tally(R_total, C_total, self.eg_x, 10)  # 10 voters max
+                R_total, C_total = self.totals[i]
+                self.totals[i] = (add_proj(R_total, to_proj(*first), ec_p),
+                                  add_proj(C_total, to_proj(*second), ec_p))
             else:
-                c1_total, c2_total = aggregated[i]
-                decrypted = elgamal.EG_decrypt(c1_total, c2_total, self.eg_x)
-                total = elgamal.bruteLog(elgamal.PARAM_G, decrypted, elgamal.PARAM_P)
-            results[self.candidates.candidate_list[i]] = total
+                c1_total, c2_total = self.totals[i]
+                self.totals[i] = ((c1_total * first) % elgamal.PARAM_P,
+                                  (c2_total * second) % elgamal.PARAM_P)
+        self.count += 1
+
+    def snapshot(self) -> list:
+        if self.elgamal_method == "el":
+            return [(to_affine(R_total, ec_p), to_affine(C_total, ec_p))
+                    for R_total, C_total in self.totals]
+        return list(self.totals)
+
+
+### tally steps, at module level so they can run in worker processes
+
+@metrics.instrumented("phase.recount")
+def aggregate_messages(elgamal_method: str, messages, num_candidates: int) -> list:
+    """
+    Homomorphically aggregates the ballots' ciphertexts, one (c1, c2) or (R, C) per candidate.
+    messages can be any iterable, it is consumed STREAM_CHUNK ballots at a time.
+    """
+    messages = iter(messages)
+    aggregated = combine_aggregates(elgamal_method, [], num_candidates)
+    while True:
+        chunk = list(islice(messages, STREAM_CHUNK))
+        if not chunk:
+            return aggregated
+        partial = _aggregate_chunk(elgamal_method, chunk, num_candidates)
+        aggregated = combine_aggregates(elgamal_method, [aggregated, partial], num_candidates)
+
+def _aggregate_chunk(elgamal_method: str, messages: list, num_candidates: int) -> list:
+    if elgamal_method == "el":
+        # EC points are collected per candidate and summed at the end,
+        # sharing the modular inversions between all the additions
+        points_R = [[] for _ in range(num_candidates)]
+        points_C = [[] for _ in range(num_candidates)]
+    else:
+        aggregated = [(1, 1) for _ in range(num_candidates)]
+
+    for msg in messages:
+        for i, (first, second) in enumerate(ballot_codec.decode_ballot(msg)):
+            if elgamal_method == "el":
+                points_R[i].append(first)
+                points_C[i].append(second)
+            else:
+                # Classic ElGamal: multiply c1 and c2
+                c1, c2 = first, second
+                aggregated[i] = (
+                    (aggregated[i][0] * c1) % elgamal.PARAM_P,
+                    (aggregated[i][1] * c2) % elgamal.PARAM_P
+                )
+    if elgamal_method == "el":
+        aggregated = [(sum_points(points_R[i], ec_p), sum_points(points_C[i], ec_p))
+                      for i in range(num_candidates)]
+    return aggregated
+
+def combine_aggregates(elgamal_method: str, partials: list, num_candidates: int) -> list:
+    """Combines the partial aggregates of several shards."""
+    if elgamal_method == "el":
+        return [(sum_points([partial[i][0] for partial in partials], ec_p),
+                 sum_points([partial[i][1] for partial in partials], ec_p))
+                for i in range(num_candidates)]
+    aggregated = [(1, 1) for _ in range(num_candidates)]
+    for partial in partials:
+        for i in range(num_candidates):
+            aggregated[i] = (
+                (aggregated[i][0] * partial[i][0]) % elgamal.PARAM_P,
+                (aggregated[i][1] * partial[i][1]) % elgamal.PARAM_P
+            )
+    return aggregated
+
+@lru_cache(maxsize=4)
+def log_table(elgamal_method: str, max_voters: int):
+    """Baby-step table shared by every candidate decrypted in this process."""
+    if elgamal_method == "el":
+        return ecelgamal.ECEG_log_table(max_voters)
+    return elgamal.EG_log_table(max_voters)
 
-        return results
\ No newline at end of file
+@metrics.instrumented("phase.decrypt")
+def decrypt_total(elgamal_method: str, aggregate: tuple, eg_x: int, max_voters: int, table=None) -> int:
+    """
+    Decrypts one candidate's aggregated ciphertext into its number of votes.
+    table: baby-step table with a bound >= max_voters, log_table() by default
+    """
+    if table is None:
+        table = log_table(elgamal_method, max_voters)
+    if elgamal_method == "el":
+        R_total, C_total = aggregate
+        return ECEG_decrypt_tally(R_total, C_total, eg_x, max_voters, table)
+    c1_total, c2_total = aggregate
+    return elgamal.EGA_decrypt_tally(c1_total, c2_total, eg_x, max_voters, table)
@@ -22,9 +22,19 @@ from candidate import Candidates
 #         return self.votes
         
         
+from array import array
+from collections.abc import Mapping
+from typing import Iterator
 from candidate import Candidates
+from ballot_codec import encode_point, decode_point, POINT_WIDTH
+
+SECRET_WIDTH = 32
+DSA_WIDTH = 256  # bytes of dsa.PARAM_P (2048 bits), not imported to keep Crypto out of startup
+EMPTY = -1
 
 class Voter:
+    __slots__ = ("name", "candidates", "sign_key_x", "sign_key_y", "votes")
+
     def __init__(self, name: str, candidates: Candidates, sign_key_x: int, sign_key_y: int):
         """
         sign_key_x: private signing key (dummy value for DSA)
@@ -43,3 +53,180 @@ class Voter:
             raise Exception(f"{self.name} must vote for exactly one candidate!")
         self.votes = voting_list
         return self.votes
+
+
+class NameIndex:
+    """
+    name -> id index without a str object per name: the UTF-8 names are
+    concatenated in one bytearray (ids in insertion order) and looked up
+    through an open-addressing table of 4-byte ids, at most 2/3 full.
+    """
+    def __init__(self):
+        self.names = bytearray()
+        self.offsets = array("I", [0])
+        self.slots = array("i", [EMPTY]) * 8
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def name(self, name_id: int) -> str:
+        return self.names[self.offsets[name_id]:self.offsets[name_id + 1]].decode()
+
+    def _slot(self, name: str, raw: bytes) -> int:
+        """Slot holding name's id, or the empty slot where it would go."""
+        mask = len(self.slots) - 1
+        i = hash(name) & mask
+        while True:
+            name_id = self.slots[i]
+            if name_id == EMPTY or self.names[self.offsets[name_id]:self.offsets[name_id + 1]] == raw:
+                return i
+            i = (i + 1) & mask
+
+    def get(self, name: str) -> int:
+        """Id of name, None if it is not in the index."""
+        name_id = self.slots[self._slot(name, name.encode())]
+        return None if name_id == EMPTY else name_id
+
+    def __contains__(self, name) -> bool:
+        return isinstance(name, str) and self.get(name) is not None
+
+    def add(self, name: str) -> int:
+        """Adds a name that is not in the index yet and returns its id."""
+        name_id = len(self)
+        if 3 * (name_id + 1) > 2 * len(self.slots):
+            self._grow()
+        raw = name.encode()
+        self.names += raw
+        self.offsets.append(len(self.names))
+        self.slots[self._slot(name, raw)] = name_id
+        return name_id
+
+    def _grow(self):
+        self.slots = array("i", [EMPTY]) * (2 * len(self.slots))
+        mask = len(self.slots) - 1
+        for name_id in range(len(self)):
+            i = hash(self.name(name_id)) & mask
+            while self.slots[i] != EMPTY:
+                i = (i + 1) & mask
+            self.slots[i] = name_id
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.name(name_id) for name_id in range(len(self)))
+
+
+class SecretKeys:
+    """
+    Private signing keys by voter id, in fixed-width slots. They are kept by
+    the voting system, apart from the registry which only holds public data.
+    """
+    def __init__(self):
+        self.keys = bytearray()
+
+    def append(self, x: int):
+        # An all-zero slot stands for a missing (None) key
+        self.keys += (x or 0).to_bytes(SECRET_WIDTH, "big")
+
+    def __getitem__(self, voter_id: int) -> int:
+        i = voter_id * SECRET_WIDTH
+        return int.from_bytes(self.keys[i:i + SECRET_WIDTH], "big") or None
+
+    def __len__(self) -> int:
+        return len(self.keys) // SECRET_WIDTH
+
+
+class VoterRegistry(Mapping):
+    """
+    Registered voters stored column-wise, in place of a dict of Voter objects:
+    a NameIndex, fixed-width public key slots packed in a bytearray
+    and a has-voted bitmap. registry[name] builds the Voter on demand,
+    without its secret key (see SecretKeys).
+    sign_method: "el" for ECDSA keys (public key stored as a compressed point), DSA otherwise
+    """
+    def __init__(self, candidates: Candidates, sign_method: str = "default"):
+        self.candidates = candidates
+        self.elliptic = sign_method == "el"
+        self.public_width = POINT_WIDTH if self.elliptic else DSA_WIDTH
+        self.index = NameIndex()
+        self.public_keys = bytearray()
+        self.voted = bytearray()
+        # Names whose ballot was recorded before they were registered (log replay)
+        self.voted_unregistered = set()
+
+    def _append(self, voter: Voter):
+        # All-zero slots stand for missing (None) keys
+        self.index.add(voter.name)
+        y = voter.sign_key_y
+        if y is None:
+            self.public_keys += bytes(self.public_width)
+        elif self.elliptic:
+            slot = bytearray(POINT_WIDTH)
+            encode_point(slot, 0, y)
+            self.public_keys += slot
+        else:
+            self.public_keys += y.to_bytes(self.public_width, "big")
+        if len(self.index) > len(self.voted) * 8:
+            self.voted.append(0)
+        if voter.name in self.voted_unregistered:
+            self.voted_unregistered.discard(voter.name)
+            self.mark_voted(voter.name)
+
+    def add(self, voter: Voter):
+        if voter.name in self.index:
+            raise Exception("Voter already exists!")
+        self._append(voter)
+
+    def add_many(self, voters: list[Voter]):
+        """Adds the voters in one pass; none is added if a name is already taken."""
+        names = set()
+        for voter in voters:
+            if voter.name in self.index or voter.name in names:
+                raise Exception("Voter already exists!")
+            names.add(voter.name)
+        for voter in voters:
+            self._append(voter)
+
+    def id_of(self, name: str) -> int:
+        voter_id = self.index.get(name)
+        if voter_id is None:
+            raise Exception("Voter not registered!")
+        return voter_id
+
+    def public_key(self, name: str):
+        i = self.id_of(name) * self.public_width
+        raw = self.public_keys[i:i + self.public_width]
+        if not any(raw):
+            return None
+        if self.elliptic:
+            return decode_point(memoryview(raw))
+        return int.from_bytes(raw, "big")
+
+    def has_voted(self, name: str) -> bool:
+        voter_id = self.id_of(name)
+        return bool(self.voted[voter_id >> 3] >> (voter_id & 7) & 1)
+
+    def mark_voted(self, name: str):
+        voter_id = self.id_of(name)
+        if self.voted[voter_id >> 3] >> (voter_id & 7) & 1:
+            raise Exception("Voter has already voted!")
+        self.voted[voter_id >> 3] |= 1 << (voter_id & 7)
+
+    def mark_replayed(self, name: str):
+        """Marks a voter as having voted, whether or not the name is registered yet."""
+        if name in self.index:
+            self.mark_voted(name)
+        else:
+            self.voted_unregistered.add(name)
+
+    def __getitem__(self, name: str) -> Voter:
+        if name not in self.index:
+            raise KeyError(name)
+        return Voter(name, self.candidates, None, self.public_key(name))
+
+    def __contains__(self, name) -> bool:
+        return name in self.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)